@@ -1,9 +1,15 @@
 #!/usr/bin/env python3
 
+import CreateCacheDir
 import DataReader
 import FA_Gamma
+import FileScanner
+import FINReader
+import OrigenExecutor
 import m_print
-import datetime, re, os, math, subprocess, string
+import datetime, re, os, math, string, hashlib
+import numpy as np
+import concurrent.futures
 
 TIME_FORMAT = '%d.%m.%Y %H:%M:%S'
 
@@ -18,6 +24,21 @@ maxW_fn = "maxW_history.txt"
 maxW2_fn = "maxW2_history.txt"
 
 MCUDIRName = "MCU_FIN"
+# Read only the R3 and R18 tally blocks of the .FIN files using
+# the cached blocks index, otherwise scan the whole files line by line
+READ_FIN_BLOCKS = True
+# Keep the parsed TAlgorithm data in the binary cache, see TAlgorithm.read_cached()
+CACHE_ALGORITHMS = True
+ALGORITHM_CACHE_VERSION = 1
+# Number of processes parsing the .FIN files in ReadStaticData(),
+# 1 parses them one after another in this process
+FIN_PARSE_WORKERS = 1
+# Storage type of the dense Green functions tensor FA_Gamma.TGreenTensor,
+# np.float32 halves the memory
+GREEN_TENSOR_DTYPE = np.float64
+# Read the Green functions from the memory mapped binary cache,
+# see FA_Gamma.read_cached_greens()
+CACHE_GREENS = True
 
 ZoneKey = "MCU zone"
 CellKey = "Cell"
@@ -48,7 +69,11 @@ RefDetEffectivenessField = "Eff"
 
 # ORIGEN-related constants
 template_file_name = "Origen_template.inp"
-scale_bin = "d:\\SCALE-6.2.4\\bin\\scalerte.exe"
+# scalerte path, may be set by SCALE_BIN environment variable,
+# "OrigenStub.py" runs the flow without SCALE
+scale_bin = os.environ.get("SCALE_BIN", "d:\\SCALE-6.2.4\\bin\\scalerte.exe")
+# Number of ORIGEN processes run at once, see RunOrigens()
+ORIGEN_WORKERS = 1
 MARKER_T = "t=[ 1234567890987654321.1234567890987654321 ]"
 MARKER_PWR = "power = [ 1234567890987654321.1234567890987654321e38 ]"
 MARKER_TREG = "tt=[ 12 34 56 78 90 98 76 54 32 10 ]"
@@ -95,23 +120,26 @@ def MakeOrigenFile(fn, str_t, str_power, str_treg):
     m_print.m_print(f"File {fn} saved")
 
 def RunOrigen(task_fn):
-    origen_fn = os.path.join(os.curdir, task_fn)
-    call_args = [scale_bin, origen_fn]
-    try:
-        result = subprocess.run(call_args, check=True,
-                                stdout=subprocess.PIPE,
-                                stderr=subprocess.PIPE,
-                                encoding='utf-8')
-        if result.returncode == 0:
-            m_print.m_print("Origen was run successfully")
-        else:
-            m_print.m_print(f"Origen's exit code was {result.returncode}")
-    except subprocess.CalledProcessError as ex:
-        m_print.m_print("Exception while Origen-ing")
-        m_print.m_print("Exit status = {}".format(ex.returncode))
-        m_print.m_print("Invokation string was {}".format(ex.cmd))
-        m_print.m_print("scalerte stdout was {}".format(ex.stdout))
-        m_print.m_print("scalerte stderr was {}".format(ex.stderr))
+    RunOrigens([task_fn])
+
+def RunOrigens(task_fns, on_done = None):
+    ''' Runs the ORIGEN decks by ORIGEN_WORKERS processes at once,
+        on_done(job) is called as soon as every job is finished
+        successfully, see OrigenExecutor.TOrigenExecutor.run().
+        CoreProcException is raised after all runs if some of them failed
+    '''
+    def on_job_done(job):
+        # The outputs of the failed run are not read
+        if job.ok and on_done is not None:
+            on_done(job)
+
+    executor = OrigenExecutor.TOrigenExecutor(scale_bin, ORIGEN_WORKERS)
+    jobs = executor.run([os.path.join(os.curdir, task_fn)
+                         for task_fn in task_fns], on_job_done)
+    failed = [job.deck_fn for job in jobs if not job.ok]
+    if len(failed) > 0:
+        raise CoreProcException(f"Origen failed for {', '.join(failed)}")
+    return jobs
 
 def ReadLine(line):
     line_pattern = re.compile(
@@ -183,6 +211,18 @@ def ReadR3Line(MCU_detectors_reader, line):
 
     return data_line_OK, detector
 
+def MapZones(reader, zones, *fields):
+    ''' Vectorized counterpart of reader[zone] for the array of zones:
+        returns the mask of the zones found in the reader and
+        the columns of the fields values of their records
+    '''
+    rec_nos = reader.get_dense_index(DataReader.RegZoneField)
+    zones = zones.astype(np.int64)
+    found = (zones >= 0) & (zones < len(rec_nos))
+    found[found] = rec_nos[zones[found]] >= 0
+    found_rec_nos = rec_nos[zones[found]]
+    return found, [reader.get_column(field)[found_rec_nos] for field in fields]
+
 # Calculated FAs - there ara whole core of them in each TAlgorithm
 class TCalcFA(object):
     def __init__(self):
@@ -200,6 +240,9 @@ class TAlgorithm(object):
     hdr_line = "         Zone          Mean        StdDev"
     R3_line  = " NUCLIDE:          MIXT, REACTION:            3, ENERGY:    0.00000E+00"
     R18_line = " NUCLIDE:          MIXT, REACTION:           18, ENERGY:    0.00000E+00"
+    # The same tables for FINReader.read_tallies()
+    R3_tally = dict(section = "ZONES", nuclide = "MIXT", reaction = 3, energy = 0.0)
+    R18_tally = dict(section = "ZONES", nuclide = "MIXT", reaction = 18, energy = 0.0)
 
     def __init__(self, FAs_reader, detectors_eff_reader, MCU_detectors_reader,
                  HCrit, NFAs, FINfn, isRefAlg):
@@ -209,78 +252,100 @@ class TAlgorithm(object):
         self.Hcrit = float(HCrit)
         self.isReference = bool(isRefAlg)
 
-        def add_detector(data_dict):
+        def add_detector(channel, R3):
             detector = Tdetector()
-            detector.channel = data_dict[ChannelKey]
-            detector.R3 = data_dict[MeanKey]
-            self.detectors[data_dict[ChannelKey]] = detector
+            detector.channel = channel
+            detector.R3 = R3
+            self.detectors[channel] = detector
 
-        def add_mod_FA(data_dict):
-            if data_dict[CellKey] not in self.FAs:
-                self.FAs[data_dict[CellKey]] = TCalcFA()
-            self.FAs[data_dict[CellKey]].fissions[data_dict[PitchKey]
-                                                ] = data_dict[MeanKey]
+        def add_mod_FA(cell, pitch, fissions):
+            if cell not in self.FAs:
+                self.FAs[cell] = TCalcFA()
+            self.FAs[cell].fissions[pitch] = fissions
 
         # Read MCU .fin file
         fn = os.path.join(MCUDIRName, FINfn)
-        R3Lines2find = 3
-        R18Lines2find = 3
-        R3Records = 0; R18Records = 0
-        R3Over = False; R18Over = False
-        with open(file = fn, mode='r', encoding='utf8') as FINfileObject:
-            finLineNo = 0
-            for finLine in FINfileObject:
-                finLineNo += 1
-                if finLine.startswith(type(self).zones_line):
-                    # print("ZONES found")
-                    R3Lines2find -= 1
-                    R18Lines2find -= 1
-                    continue
-                if finLine.startswith(type(self).objects_line):
-                    # print("OBJECTS found")
-                    R3Lines2find += 10
-                    R18Lines2find += 10
-                    continue
-                if finLine.startswith(type(self).R3_line):
-                    # print("MIX R3 found")
-                    R3Lines2find -= 1
-                    continue
-                if finLine.startswith(type(self).R18_line):
-                    # print("MIX R18 found")
-                    R18Lines2find -= 1
-                    continue
-                if R3Lines2find == 1 and finLine.startswith(type(self).hdr_line):
-                    R3Lines2find -= 1
-                    continue
-                if R3Lines2find == 0:
-                    # Read MIX R3 info
-                    # print(f"Reading R3, line no = {finLineNo}")
-                    data_line_OK, data_dict = ReadR3Line(MCU_detectors_reader, finLine)
-                    if not data_line_OK:
-                        # Finished reading R3 array
+        if READ_FIN_BLOCKS:
+            # Zone Mean StdDev tables are decoded at once,
+            # the zones unknown to the readers are skipped
+            selection = {"R3": type(self).R3_tally, "R18": type(self).R18_tally}
+            tallies = FINReader.read_tallies(fn, selection)
+            for name, criteria in selection.items():
+                if len(tallies[name]) == 0:
+                    raise FINReader.FINBlockNotFound(fn, criteria)
+            R3_tally = tallies["R3"][0]
+            found, (channels,) = MapZones(MCU_detectors_reader, R3_tally.keys,
+                                          R3ChannelField)
+            for channel, R3 in zip(channels.astype(np.int64).tolist(),
+                                   R3_tally.means[found].tolist()):
+                add_detector(channel, R3)
+            R18_tally = tallies["R18"][0]
+            found, (cells, pitches) = MapZones(FAs_reader, R18_tally.keys,
+                                               R18CellField, R18PitchField)
+            for cell, pitch, fissions in zip(cells.tolist(),
+                                             pitches.astype(np.int64).tolist(),
+                                             R18_tally.means[found].tolist()):
+                add_mod_FA(cell, pitch, fissions)
+        else:
+            R3Lines2find = 3
+            R18Lines2find = 3
+            R3Records = 0; R18Records = 0
+            R3Over = False; R18Over = False
+            with open(file = fn, mode='r', encoding='utf8') as FINfileObject:
+                finLineNo = 0
+                for finLine in FINfileObject:
+                    finLineNo += 1
+                    if finLine.startswith(type(self).zones_line):
+                        # print("ZONES found")
+                        R3Lines2find -= 1
+                        R18Lines2find -= 1
+                        continue
+                    if finLine.startswith(type(self).objects_line):
+                        # print("OBJECTS found")
                         R3Lines2find += 10
-                        R3Over = True
-                    elif data_dict[RecUsefullKey]:
-                        # print_dict(data_dict)
-                        add_detector(data_dict)
-                        R3Records += 1
-                if R18Lines2find == 1 and finLine.startswith(type(self).hdr_line):
-                    R18Lines2find -= 1
-                    continue
-                if R18Lines2find == 0:
-                    # Read MIX R18 info
-                    # print(f"Reading R18, line no = {finLineNo}")
-                    data_line_OK, data_dict = ReadR18Line(FAs_reader, finLine)
-                    if not data_line_OK:
-                        # Finished reading R18 array
                         R18Lines2find += 10
-                        R18Over = True
-                    elif data_dict[RecUsefullKey]:
-                        # print_dict(data_dict)
-                        add_mod_FA(data_dict)
-                        R18Records += 1
-                if R3Over and R18Over:
-                    break
+                        continue
+                    if finLine.startswith(type(self).R3_line):
+                        # print("MIX R3 found")
+                        R3Lines2find -= 1
+                        continue
+                    if finLine.startswith(type(self).R18_line):
+                        # print("MIX R18 found")
+                        R18Lines2find -= 1
+                        continue
+                    if R3Lines2find == 1 and finLine.startswith(type(self).hdr_line):
+                        R3Lines2find -= 1
+                        continue
+                    if R3Lines2find == 0:
+                        # Read MIX R3 info
+                        # print(f"Reading R3, line no = {finLineNo}")
+                        data_line_OK, data_dict = ReadR3Line(MCU_detectors_reader, finLine)
+                        if not data_line_OK:
+                            # Finished reading R3 array
+                            R3Lines2find += 10
+                            R3Over = True
+                        elif data_dict[RecUsefullKey]:
+                            # print_dict(data_dict)
+                            add_detector(data_dict[ChannelKey], data_dict[MeanKey])
+                            R3Records += 1
+                    if R18Lines2find == 1 and finLine.startswith(type(self).hdr_line):
+                        R18Lines2find -= 1
+                        continue
+                    if R18Lines2find == 0:
+                        # Read MIX R18 info
+                        # print(f"Reading R18, line no = {finLineNo}")
+                        data_line_OK, data_dict = ReadR18Line(FAs_reader, finLine)
+                        if not data_line_OK:
+                            # Finished reading R18 array
+                            R18Lines2find += 10
+                            R18Over = True
+                        elif data_dict[RecUsefullKey]:
+                            # print_dict(data_dict)
+                            add_mod_FA(data_dict[CellKey], data_dict[PitchKey],
+                                       data_dict[MeanKey])
+                            R18Records += 1
+                    if R3Over and R18Over:
+                        break
 
         # Calculate total core fissions
         self.total_fissions = float(0)
@@ -293,6 +358,171 @@ class TAlgorithm(object):
             for span in FA.fissions:
                 FA.fissions[span] /= self.total_fissions
 
+    def save_cache(self, cache_fn, meta):
+        ''' Saves the parsed fission distribution and detectors R3 values,
+            Hcrit and the reference flag come from FINsListFile every time
+        '''
+        cells = list(self.FAs)
+        cell_codes = list(); spans = list(); fissions = list()
+        for cell_code, FA in enumerate(self.FAs.values()):
+            for span, span_fissions in FA.fissions.items():
+                cell_codes.append(cell_code)
+                spans.append(span)
+                fissions.append(span_fissions)
+        arrays = {"cells": np.array(cell_codes, dtype = np.int32),
+                  "spans": np.array(spans, dtype = np.int32),
+                  "fissions": np.array(fissions, dtype = np.float64),
+                  "channels": np.array(list(self.detectors), dtype = np.int64),
+                  "R3": np.array([det.R3 for det in self.detectors.values()],
+                                 dtype = np.float64)}
+        meta = dict(meta, cells = cells, total_fissions = self.total_fissions)
+        DataReader.save_arrays(cache_fn, meta, arrays)
+
+    @classmethod
+    def from_cache(cls, arrays, meta, HCrit, isRefAlg):
+        alg = cls.__new__(cls)
+        alg.FAs = dict()
+        alg.detectors = dict()
+        alg.Hcrit = float(HCrit)
+        alg.isReference = bool(isRefAlg)
+        alg.total_fissions = meta["total_fissions"]
+
+        cells = meta["cells"]
+        for cell_code, span, span_fissions in zip(arrays["cells"].tolist(),
+                                                  arrays["spans"].tolist(),
+                                                  arrays["fissions"].tolist()):
+            cell = cells[cell_code]
+            if cell not in alg.FAs:
+                alg.FAs[cell] = TCalcFA()
+            alg.FAs[cell].fissions[span] = span_fissions
+        for channel, R3 in zip(arrays["channels"].tolist(), arrays["R3"].tolist()):
+            detector = Tdetector()
+            detector.channel = channel
+            detector.R3 = R3
+            alg.detectors[channel] = detector
+        return alg
+
+    @classmethod
+    def read_cached(cls, FAs_reader, detectors_eff_reader, MCU_detectors_reader,
+                    HCrit, NFAs, FINfn, isRefAlg, config_hash,
+                    cache_dir = CreateCacheDir.CacheDir):
+        ''' TAlgorithm restored from the binary cache if the .FIN file
+            and the MCU zones configuration (config_hash, see
+            MCU_config_hash()) are the same as they were when it was parsed
+        '''
+        fn = os.path.join(MCUDIRName, FINfn)
+        cache_fn = DataReader.cache_file_name(fn, "TAlgorithm", cache_dir)
+        stat = os.stat(fn)
+        FIN_hash = None
+        try:
+            meta, arrays = DataReader.load_arrays(cache_fn)
+            if (meta["version"] == ALGORITHM_CACHE_VERSION and
+                meta["config_hash"] == config_hash and
+                meta["size"] == stat.st_size):
+                valid = (meta["mtime"] == stat.st_mtime_ns)
+                if not valid:
+                    FIN_hash = DataReader.file_hash(fn)
+                    valid = (meta["hash"] == FIN_hash)
+                if valid:
+                    alg = cls.from_cache(arrays, meta, HCrit, isRefAlg)
+                    if meta["mtime"] != stat.st_mtime_ns:
+                        alg.save_cache(cache_fn, dict(meta, mtime = stat.st_mtime_ns))
+                    return alg
+        except (OSError, KeyError, IndexError, TypeError, ValueError):
+            # No cache entry yet or it is unreadable
+            pass
+
+        if FIN_hash is None:
+            FIN_hash = DataReader.file_hash(fn)
+        alg = cls(FAs_reader, detectors_eff_reader, MCU_detectors_reader,
+                  HCrit, NFAs, FINfn, isRefAlg)
+        alg.save_cache(cache_fn, {"version": ALGORITHM_CACHE_VERSION,
+                                  "config_hash": config_hash,
+                                  "size": stat.st_size,
+                                  "mtime": stat.st_mtime_ns,
+                                  "hash": FIN_hash})
+        return alg
+
+def MCU_config_hash():
+    ''' Hash of the MCU zones configuration files used by TAlgorithm
+    '''
+    hashes = [DataReader.file_hash(fn) for fn in (MCU_FAs_fn, MCU_detectors_fn)]
+    return hashlib.sha256(" ".join(hashes).encode("utf8")).hexdigest()
+
+def make_algorithm(readers, HCrit, NFAs, FINfn, isRefAlg, config_hash):
+    ''' TAlgorithm parsed or read from the cache if config_hash is given
+    '''
+    if config_hash is None:
+        return TAlgorithm(*readers, HCrit, NFAs, FINfn, isRefAlg)
+    return TAlgorithm.read_cached(*readers, HCrit, NFAs, FINfn, isRefAlg,
+                                  config_hash)
+
+# Config readers of the .FIN parsing worker process, see init_FIN_worker()
+FIN_worker_readers = None
+
+def init_FIN_worker(readers, read_FIN_blocks):
+    global FIN_worker_readers, READ_FIN_BLOCKS
+    FIN_worker_readers = readers
+    READ_FIN_BLOCKS = read_FIN_blocks
+
+def parse_FIN(alg_args):
+    return make_algorithm(FIN_worker_readers, *alg_args)
+
+
+# Dense fission fractions of all the algorithms:
+# K[alg_no, cell_no, span] is Algorithms[alg_keys[alg_no]
+#                               ].FAs[cells[cell_no]].fissions[span]
+# alg_nos and cell_nos are the reverse maps of alg_keys and cells,
+# the spans missing in the algorithm have zero K and False defined.
+class TFissionTensor(object):
+    # The tensor of the last algorithms dictionary, see of()
+    last = None
+
+    def __init__(self, algorithms):
+        self.algorithms = algorithms
+        self.alg_objects = list(algorithms.values())
+        self.alg_keys = list(algorithms)
+        self.alg_nos = {alg_key: n for n, alg_key in enumerate(self.alg_keys)}
+        self.NFAs = np.array([alg_key[1] for alg_key in self.alg_keys],
+                             dtype = np.int64)
+        self.cells = list()
+        self.cell_nos = dict()
+        self.spans = 0
+        for alg in self.alg_objects:
+            for cell, FA in alg.FAs.items():
+                if cell not in self.cell_nos:
+                    self.cell_nos[cell] = len(self.cells)
+                    self.cells.append(cell)
+                if len(FA.fissions) > 0:
+                    self.spans = max(self.spans, max(FA.fissions) + 1)
+
+        self.K = np.zeros((len(self.alg_keys), len(self.cells), self.spans),
+                          dtype = np.float64)
+        self.defined = np.zeros(self.K.shape, dtype = bool)
+        for alg_no, alg in enumerate(self.alg_objects):
+            for cell, FA in alg.FAs.items():
+                cell_no = self.cell_nos[cell]
+                spans = list(FA.fissions)
+                self.K[alg_no, cell_no, spans] = list(FA.fissions.values())
+                self.defined[alg_no, cell_no, spans] = True
+
+    @classmethod
+    def of(cls, algorithms):
+        ''' The tensor is built once for the algorithms dictionary
+            and rebuilt only if other algorithms are passed
+        '''
+        tensor = cls.last
+        if (tensor is None or tensor.algorithms is not algorithms or
+            len(tensor.alg_objects) != len(algorithms) or
+            any(alg is not tensor_alg for alg, tensor_alg
+                in zip(algorithms.values(), tensor.alg_objects))):
+            tensor = cls(algorithms)
+            cls.last = tensor
+        return tensor
+
+    def alg_no(self, alg_name, NFAs):
+        return self.alg_nos[(alg_name, NFAs)]
+
 
 # Actual FAs
 class TFA(object):
@@ -453,7 +683,11 @@ class TEnvelopeFAspanHistory(object):
 
 class TCoreHistory(object):
     history_fn = "Core_history.txt"
+    history_schema = "t: datetime, N(W): float, Algorithm: str, FAs: int"
     Origen_fns = ["max_burnup", "max_2_hours", "envelope"]
+    # History reader is shared by all TCoreHistory instances,
+    # see read_history()
+    history_reader = None
 
     def append_history_rec(self, t, N, alg, FAs):
         with open(file = type(self).history_fn, mode='at',
@@ -463,6 +697,19 @@ class TCoreHistory(object):
             data_file_object.write(line)
 
 
+    # Only the history records appended since the previous
+    # TCoreHistory creation are parsed, the file being rewritten
+    # is reread completely
+    @classmethod
+    def read_history(cls, fn):
+        reader = cls.history_reader
+        if reader is None or reader.data_file_name != fn:
+            reader = DataReader.TDataReader(fn, schema = cls.history_schema)
+            cls.history_reader = reader
+        else:
+            reader.refresh()
+        return reader
+
     def __init__(self, _algorithms, _Greens):
         TimeField = "t"
         PowerField = "N(W)"
@@ -487,7 +734,7 @@ class TCoreHistory(object):
         # print(f"A record added to {type(self).history_fn}")
 
         # Now read the previous core history
-        HistoryReader = DataReader.TDataReader(type(self).history_fn)
+        HistoryReader = type(self).read_history(type(self).history_fn)
         m_print.m_print("History file read successfully")
         m_print.m_print("Fields: ")
         m_print.m_print(HistoryReader.fields)
@@ -531,6 +778,15 @@ class TCoreHistory(object):
         # cell is core cell with this much energy emission
         self.Wenvelope_axial = dict()
 
+        # Fission fractions of the reference algorithm cells in self.FAs
+        # order for every algorithm, K_cells[alg_no, cell_no, FAspan]
+        self.fission_tensor = TFissionTensor.of(self.algorithms)
+        FA_cells = list(self.FAs)
+        K_cells = self.fission_tensor.K[:, [self.fission_tensor.cell_nos[cell]
+                                            for cell in FA_cells], :]
+        burnups = np.zeros(K_cells.shape[1:])
+        burnups2 = np.zeros(K_cells.shape[1:])
+
         # Prev 2 hours
         last_history_time = HistoryReader.raw_data[-1][TimeIndex]
         dt2h = datetime.timedelta(hours = 2)
@@ -548,33 +804,31 @@ class TCoreHistory(object):
                  datetime.timedelta(microseconds = 1) / 1.0e6)
             burnup = pwr * dt
             prev_history_time = time
-            max_burnup = 0.0
-            max_cell = ""
-            max_span = -1
-            max_K = 0.0
-            for FA in self.FAs:
-                for FAspan in self.FAs[FA].burnup:
-                    K = self.algorithms[(alg_name, alg_FAs)
-                                        ].FAs[FA].fissions[FAspan]
-                    # Accumulate the total burnup
-                    span_burnup = burnup * K
-                    self.FAs[FA].burnup[FAspan] += span_burnup
-                    # Find the maximum for envelope
-                    if span_burnup > max_burnup:
-                        max_burnup = span_burnup
-                        max_cell = FA
-                        max_span = FAspan
-                        max_K = K
+            K = K_cells[self.fission_tensor.alg_no(alg_name, alg_FAs)]
+            # Accumulate the total burnup
+            span_burnups = burnup * K
+            burnups += span_burnups
+            # Find the maximum for envelope
+            max_no = int(np.argmax(span_burnups))
+            if span_burnups.flat[max_no] > 0.0:
+                max_cell_no, max_span = divmod(max_no, K.shape[1])
+                max_cell = FA_cells[max_cell_no]
+                max_K = float(K.flat[max_no])
+            else:
+                max_cell = ""
+                max_span = -1
+                max_K = 0.0
             self.Wenvelope_history.add_point(
                               time, pwr*max_K, max_cell, max_span)
 
-            for FA in self.FAs2:
-                for FAspan in self.FAs2[FA].burnup:
-                    K = self.algorithms[(alg_name, alg_FAs)
-                                        ].FAs[FA].fissions[FAspan]
-                    # Accumulate the burnup for last 2 hours
-                    if time > last2hours:
-                        self.FAs2[FA].burnup[FAspan] += burnup * K
+            # Accumulate the burnup for last 2 hours
+            if time > last2hours:
+                burnups2 += span_burnups
+
+        for cell_no, cell in enumerate(FA_cells):
+            for FAspan in self.FAs[cell].burnup:
+                self.FAs[cell].burnup[FAspan] = float(burnups[cell_no, FAspan])
+                self.FAs2[cell].burnup[FAspan] = float(burnups2[cell_no, FAspan])
 
         # Now let's find the FA span with the maximum total burnup
         # And FA span burnup envelope
@@ -647,26 +901,16 @@ class TCoreHistory(object):
 
         spectrum_line = "Gamma source intensity (1/s) as a function of time"
         hdr_line = "boundaries (MeV)"
-        Lines2Find = 3
         srcRecords = 0
-        with open(file = fn, mode='r', encoding='cp1251') as OrigenfileObject:
-            OrigenLineNo = 0
-            for OrigenLine in OrigenfileObject:
-                OrigenLineNo += 1
-                if OrigenLine.find(spectrum_line) != -1:
-                    Lines2Find -= 1
-                    continue
-                if (Lines2Find == 2 and
-                    all(x=='-' for x in OrigenLine.strip(string.whitespace))):
-                    Lines2Find -= 1
-                    continue
-                if (Lines2Find == 1 and
-                    OrigenLine.find(hdr_line) != -1):
-                    Lines2Find -= 1
-                    continue
-                if Lines2Find == 0:
+        # Only the spectrum table is decoded, the rest of ~1 MB output
+        # is searched for the markers as bytes
+        with FileScanner.TFileScanner(fn, encoding = 'cp1251') as scanner:
+            pos = scanner.find(spectrum_line.encode('cp1251'))
+            if pos != -1:
+                pos = scanner.find(hdr_line.encode('cp1251'), scanner.next_line(pos))
+            if pos != -1:
+                for OrigenLine in scanner.iter_lines(scanner.next_line(pos)):
                     # Read Origen spectrum part
-                    # m_print.m_print(f"Reading sources, line no = {OrigenLineNo}")
                     values = ParseOrigenLine(OrigenLine)
                     if values is None:
                         # Finished reading sources
@@ -693,7 +937,10 @@ class TCoreHistory(object):
         containers = [self.Wmax_src_spectrums,
                       self.Wmax2_src_spectrums,
                       self.Wenvelope_src_spectrums]
-        # Calls ORIGEN 3 times
+        # Calls ORIGEN 3 times. The run is switched off here and the .out
+        # files of the previous runs are parsed, so the decks are neither
+        # run by RunOrigens() nor looked up in the ORIGEN cache as
+        # Test_plan.TCoreHistory.RunOrigenHistories() does
         methods = [self.Wmax_history.build_origen_params,
                    self.Wmax2_history.build_origen_params,
                    self.Wenvelope_history.build_origen_params]
@@ -719,57 +966,18 @@ class TCoreHistory(object):
                0.8e6:3.73,  1e6:4.48,   2e6:7.49,   4e6:12.0,    6e6:16.0,
                8e6:19.9,    10e6:23.8}
 
-        # Registered gamma energies
-        Zones0 = list(self.Greens[1].values())[0]
-        ERegs = list(list(Zones0.values())[0].keys())
-        # m_print.m_print(ERegs)
-        # Initial zero flux in the reg zone
-        # times are kept in self.tregs
-        reg_fluxes = {k:[0.0]*len(self.tregs) for k in ERegs}
-
-        # Iterate over source span
-        for src in range(1, 11):
-            if src <= 5:
-                IncGamma = self.Greens[src]
-                reg_zone = zone
-            else:
-                IncGamma = self.Greens[11 - src]
-                ZoneRemoteness = zone // 10
-                ZoneHeight = zone % 10
-                reg_zone = 10 * ZoneRemoteness + (9 - ZoneHeight)
-            K_axial = axial[src-1]
-            # Iterate over incident energy
-            for Esrc in IncGamma:
-                # Check whether the incident energy is in ORIGEN range
-                for OrigenKey in sources:
-                    if OrigenKey[0] <= Esrc <= OrigenKey[1]:
-                        RegZone = IncGamma[Esrc][reg_zone]
-                        # Iterate over dissipated flux
-                        for flux in RegZone:
-                            # Accumulate gamma-flux in reg_fluxes
-                            # Iterate over registration time
-                            for n_pt, origen_out in enumerate(sources[OrigenKey]):
-                                reg_fluxes[flux][n_pt
-                                      ] += K_axial * RegZone[flux] * origen_out
-                        break
-        #m_print.m_print("Times are:")
-        #m_print.m_print(self.tregs)
-        #m_print.m_print("reg_fluxes are:")
-        #m_print.m_print(reg_fluxes)
-
-        # Now sum with the NRB weights to get the doze rate
-        dozeRates = [0.0] * len(self.tregs)
-        for E_NRB in NRB:
-            for Elow, EHigh in zip(ERegs[:-1], ERegs[1:]):
-                if Elow <= E_NRB <= EHigh:
-                    # Iterate over reg time
-                    for n in range(len(dozeRates)):
-                        dozeRates[n] += reg_fluxes[EHigh][n] * NRB[E_NRB] * 1e-12
+        tensor = FA_Gamma.TGreenTensor.of(self.Greens, GREEN_TENSOR_DTYPE)
+        kernel = FA_Gamma.TDoseKernel.read_cached(tensor, NRB, list(sources))
+        # Spans 5..9 are the mirror images of 4..0, see FA_Gamma.TDoseKernel.dose()
+        K_axial = np.array([axial[FA_span] for FA_span in range(kernel.FA_spans)])
+        S = K_axial[:, None, None] * np.array(list(sources.values()),
+                                              dtype = np.float64)
+        dozeRates = kernel.dose(S, [zone])[0].tolist()
         return dozeRates
 
 
-def ReadStaticData(FINsListFile):
-    FINsReader = DataReader.TDataReader(FINsListFile)
+def ReadStaticData(FINsListFile, workers = None):
+    FINsReader = DataReader.read_cached(FINsListFile)
     m_print.m_print("Fields: ")
     m_print.m_print(FINsReader.fields)
     m_print.m_print(f"Total {len(FINsReader.raw_data)} data records")
@@ -781,20 +989,40 @@ def ReadStaticData(FINsListFile):
     FINName_index = FINsReader.find_field_index(FINFileName)
     isRef_index = FINsReader.find_field_index(ReferenceField)
 
-    FAs_reader = DataReader.TDataReader(MCU_FAs_fn)
-    detectors_eff_reader = DataReader.TDataReader(detectors_eff_fn)
-    MCU_detectors_reader = DataReader.TDataReader(MCU_detectors_fn)
-
+    FAs_reader = DataReader.read_cached(MCU_FAs_fn)
+    detectors_eff_reader = DataReader.read_cached(detectors_eff_fn)
+    MCU_detectors_reader = DataReader.read_cached(MCU_detectors_fn)
+    readers = (FAs_reader, detectors_eff_reader, MCU_detectors_reader)
+    config_hash = MCU_config_hash() if CACHE_ALGORITHMS else None
+    if workers is None:
+        workers = FIN_PARSE_WORKERS
+
+    alg_keys = list()
+    FINfns = list()
+    alg_args = list()
     for alg_param in FINsReader.raw_data:
         alg_name = alg_param[alg_index]
         HCrit = alg_param[hcrit_index]
         NFAs = int(alg_param[NFAs_index])
         FINfn = alg_param[FINName_index]
         isRefAlg = alg_param[isRef_index]
-        alg = TAlgorithm(FAs_reader, detectors_eff_reader,
-                         MCU_detectors_reader,
-                         HCrit, NFAs, FINfn, isRefAlg)
-        alg_key = (alg_name, NFAs)
+        alg_keys.append((alg_name, NFAs))
+        FINfns.append(FINfn)
+        alg_args.append((HCrit, NFAs, FINfn, isRefAlg, config_hash))
+
+    if workers > 1 and len(alg_args) > 1:
+        # The .FIN files are independent, the results are merged
+        # in the FINsListFile order anyway
+        with concurrent.futures.ProcessPoolExecutor(
+                max_workers = min(workers, len(alg_args)),
+                initializer = init_FIN_worker,
+                initargs = (readers, READ_FIN_BLOCKS)) as executor:
+            parsed_algs = list(executor.map(parse_FIN, alg_args))
+    else:
+        parsed_algs = (make_algorithm(readers, *args) for args in alg_args)
+
+    for alg_key, FINfn, alg in zip(alg_keys, FINfns, parsed_algs):
+        alg_name, NFAs = alg_key
         Algorithms[alg_key] = alg
         m_print.m_print(f"{FINfn} read successfully")
         m_print.m_print(f"{alg_name} {len(alg.FAs)} FAs {len(alg.detectors)} detectors {alg.total_fissions} fissions")
@@ -802,7 +1030,7 @@ def ReadStaticData(FINsListFile):
     m_print.m_print(f"{len(Algorithms)} algorithms/FIN files were read")
 
     # Now read reference detectors effectivenesses
-    RefEffReader = DataReader.TDataReader(detectors_eff_fn)
+    RefEffReader = detectors_eff_reader
 
     channel_index = RefEffReader.find_field_index(RefDetChannelField)
     eff_index = RefEffReader.find_field_index(RefDetEffectivenessField)
@@ -831,13 +1059,24 @@ def ReadStaticData(FINsListFile):
 
     return Algorithms
 
+def ReadGreens():
+    ''' Green functions for TCoreHistory and their FA_Gamma.TGreenTensor.
+        With CACHE_GREENS they are the memory mapped tensor itself, not
+        the nested dictionaries, TCoreHistory needs only the tensor
+    '''
+    if CACHE_GREENS:
+        GreenTensor = FA_Gamma.read_cached_greens().astype(GREEN_TENSOR_DTYPE)
+        return GreenTensor, GreenTensor
+    Greens = FA_Gamma.readGreenFuncs()
+    return Greens, FA_Gamma.TGreenTensor.of(Greens, GREEN_TENSOR_DTYPE)
+
 if __name__ == "__main__":
     start_time = datetime.datetime.now()
     m_print.m_print('Start time is ',
           start_time.strftime(TIME_FORMAT))
 
     Algorithms = ReadStaticData(FINsListFile)
-    Greens = FA_Gamma.readGreenFuncs()
+    Greens, GreenTensor = ReadGreens()
 
     try:
         CoreHistory = TCoreHistory(Algorithms, Greens)
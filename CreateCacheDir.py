@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+"""
+Модуль CreateCacheDir
+---------------------
+
+Назначение:
+    - Определить общий каталог для кэшей разобранных исходных данных
+      (конфигурационные файлы, .FIN файлы MCU, функции Грина).
+
+Каталог не создаётся при импорте, его создают
+DataReader.cache_file_name() и DataReader.save_arrays()
+при записи первого кэша.
+
+Каталог можно удалить целиком в любой момент, кэши будут
+построены заново при следующем запуске.
+
+Использование:
+    import CreateCacheDir, DataReader
+    cache_path = DataReader.cache_file_name("MCU_FAs.txt", "auto",
+                                            CreateCacheDir.CacheDir)
+    DataReader.save_arrays(cache_path, meta, arrays)   # формат TVSARR01
+"""
+
+import os
+
+# Базовый каталог – каталог, где расположен данный файл (корень проекта)
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Каталог для кэшей – папка "Cache" в корне проекта
+CacheDir = os.path.join(BASE_DIR, "Cache")
@@ -1,10 +1,29 @@
 #!/usr/bin/env python3
 
-import datetime, itertools, re, math
+import CreateCacheDir
+import datetime, itertools, re, math, sys, os, hashlib, json
+import numpy as np
 
 
 RegZoneField = "RegZone"
 
+TIME_FORMAT = '%d.%m.%Y %H:%M:%S'
+
+# Special schema value: guess the column types from the first data line
+AUTO_SCHEMA = "auto"
+# Type names allowed in the schema strings
+SchemaTypes = {"float": float, "int": int, "str": str,
+               "datetime": datetime.datetime}
+
+# Number of records buffered as tuples before they are
+# packed into the columns in the columnar mode
+COLUMNAR_CHUNK = 65536
+# Number of bytes before the end of the parsed data compared
+# by TDataReader.refresh() to detect a rewritten file
+TAIL_CHECK_BYTES = 256
+# Format version of the parsed data cache files, see read_cached()
+CACHE_VERSION = 1
+
 class DataReaderException(Exception):
     pass
 
@@ -29,11 +48,446 @@ class FieldError(DataReaderException):
     def __str__(self):
         return ("Field error: " + self.description)
 
+# String column of the columnar mode: every distinct string is
+# stored (interned) once, rows keep only integer codes
+class TCategoryColumn(object):
+    def __init__(self, codes, categories):
+        self.codes = codes              # np.int32 array
+        self.categories = categories    # list of str
+
+    @classmethod
+    def from_strings(cls, strings):
+        categories = list()
+        code_of = dict()
+        codes = np.empty(len(strings), dtype = np.int32)
+        for n, value in enumerate(strings):
+            code = code_of.get(value)
+            if code is None:
+                code = len(categories)
+                code_of[value] = code
+                categories.append(sys.intern(value))
+            codes[n] = code
+        return cls(codes, categories)
+
+    @classmethod
+    def concatenate(cls, columns):
+        categories = list()
+        code_of = dict()
+        codes = list()
+        for column in columns:
+            remap = np.empty(len(column.categories), dtype = np.int32)
+            for n, value in enumerate(column.categories):
+                code = code_of.get(value)
+                if code is None:
+                    code = len(categories)
+                    code_of[value] = code
+                    categories.append(value)
+                remap[n] = code
+            codes.append(remap[column.codes])
+        if len(codes) == 0:
+            return cls(np.empty(0, dtype = np.int32), categories)
+        return cls(np.concatenate(codes), categories)
+
+    def code_of(self, value):
+        ''' Code of the string value or -1, suitable for
+            vectorized comparison like column.codes == column.code_of(s)
+        '''
+        try:
+            return self.categories.index(value)
+        except ValueError:
+            return -1
+
+    def take(self, order):
+        return type(self)(self.codes[order], self.categories)
+
+    def item(self, rec_no):
+        return self.categories[self.codes[rec_no]]
+
+    def tolist(self):
+        return [self.categories[code] for code in self.codes.tolist()]
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            return self.item(key)
+        return self.take(key)
+
+def make_column(values, data_type):
+    ''' Packs the list of parsed values of one field into
+        the typed column
+    '''
+    if data_type is str:
+        return TCategoryColumn.from_strings(values)
+    elif data_type is datetime.datetime:
+        return np.array(values, dtype = "datetime64[s]")
+    elif data_type is int:
+        return np.array(values, dtype = np.int64)
+    else:
+        return np.array(values, dtype = np.float64)
+
+def concatenate_columns(chunks, data_type):
+    if data_type is str:
+        return TCategoryColumn.concatenate(chunks)
+    if len(chunks) == 0:
+        return make_column(list(), data_type)
+    return np.concatenate(chunks)
+
+# raw_data replacement in the columnar mode: the records are
+# built on request from the columns as tuples of the same
+# Python types as in the ordinary mode
+class TColumnarRows(object):
+    def __init__(self, columns):
+        self.columns = columns
+
+    def __len__(self):
+        if len(self.columns) == 0:
+            return 0
+        return len(self.columns[0])
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [self[n] for n in range(*key.indices(len(self)))]
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError("record index out of range")
+        return tuple(column.item(key) for column in self.columns)
+
+    def __iter__(self):
+        for start in range(0, len(self), COLUMNAR_CHUNK):
+            stop = start + COLUMNAR_CHUNK
+            yield from zip(*(column[start:stop].tolist()
+                             for column in self.columns))
+
+# First meaningful line of the data file is the header
+# if all its items are field names
+def parse_header(record):
+    string_pattern = re.compile(r"^[^0-9]\S*$")
+    fields = record
+    if not all(string_pattern.match(field) is not None
+               for field in fields):
+        fields = list()
+    return fields
+
+# Data item patterns, the same for the guessing and the typed parsers
+string_pattern = re.compile(
+    r"""^(?P<string>\S+)$""")
+int_number_pattern = re.compile(
+    r"""^(?P<number>[-+]?[0-9]+)$""")
+float_number_pattern = re.compile(
+    r"""^(?P<number>                   # To create symbolic group
+          [-+]?[0-9]*[.]?[0-9]+        # Mantissa part
+          ([eE][-+]?[0-9]+)?)$         # Optional exponent
+    """, re.VERBOSE)
+datetime_pattern = re.compile(
+    r"""^(?P<day>[0-9]{1,2})[.]        # Day
+         (?P<month>[0-9]{2})[.]        # Month
+         (?P<year>[0-9]{4})[ ]         # Year
+         (?P<hour>[0-9]{1,2})[:]       # Hours
+         (?P<min>[0-9]{2})[:]          # Minutes
+         (?P<sec>[0-9]{2})$            # Seconds
+     """, re.VERBOSE)
+
+def parse_error(data_file_name, line_no, data_string):
+    return IncorrectFileFormat(data_file_name, line_no,
+                               "error parsing " + data_string)
+
+def fields_mismatch(data_file_name, line_no, n_fields, n_values):
+    return IncorrectFileFormat(data_file_name, line_no,
+            "{fld_no:d} fields but {vals:d} data values".format(
+                fld_no = n_fields, vals = n_values))
+
+# Data line parsing with the type guess for every item
+def parse_data_record(record, data_file_name, line_no):
+    data_tuple = tuple()
+
+    for data_string in record:
+        int_num_match   = int_number_pattern.match(data_string)
+        float_num_match = float_number_pattern.match(data_string)
+        datetime_match  = datetime_pattern.match(data_string)
+        string_match    = string_pattern.match(data_string)
+        # int matching is disabled for a while
+        # because float is good enough
+        #if int_num_match is not None:
+        #    data_value = int(int_num_match.group("number"))
+        if float_num_match is not None:
+            data_value = float(float_num_match.group("number"))
+        elif datetime_match is not None:
+            day     = int(datetime_match.group("day"))
+            month   = int(datetime_match.group("month"))
+            year    = int(datetime_match.group("year"))
+            hours   = int(datetime_match.group("hour"))
+            minutes = int(datetime_match.group("min"))
+            seconds = int(datetime_match.group("sec"))
+            data_value = datetime.datetime(
+                year = year, month = month, day = day,
+                hour = hours, minute = minutes, second = seconds,
+                microsecond = 0)
+        elif string_match is not None:
+            data_value = str(string_match.group("string"))
+        else:
+            raise parse_error(data_file_name, line_no, data_string)
+        data_tuple += (data_value,)
+
+    return data_tuple
+
+def parse_datetime(data_string):
+    return datetime.datetime.strptime(data_string, TIME_FORMAT)
+
+# Whole column converters of the typed parser
+TypeConverters = {float: float, int: int, str: str,
+                  datetime.datetime: parse_datetime}
+# Patterns of the items the typed parser accepts, the same
+# as parse_data_record() accepts
+TypePatterns = {float: float_number_pattern, int: int_number_pattern,
+                str: string_pattern, datetime.datetime: datetime_pattern}
+# Cheap checks of the whole converted column: they find the items
+# the converter accepts but TypePatterns rejects ("nan", "inf",
+# "1_000", " 1", "1.", non-ASCII digits, empty or blank strings)
+# by a few substring searches in the items joined by tabs, only
+# the columns they find something in are matched item by item
+AsciiBlanks = (" ", "\x0b", "\x0c", "\x1c", "\x1d", "\x1e", "\x1f")
+# "n" and "N" are in every spelling of nan, inf and infinity
+IntSuspects = AsciiBlanks + ("_",)
+FloatSuspects = IntSuspects + ("n", "N")
+dot_without_digits = re.compile(r"[.](?:[^0-9]|$)")
+
+def has_any(text, substrings):
+    return not text.isascii() or any(map(text.__contains__, substrings))
+
+def suspect_floats(strings):
+    text = "\t".join(strings)
+    return (has_any(text, FloatSuspects) or
+            dot_without_digits.search(text) is not None)
+
+def suspect_ints(strings):
+    return has_any("\t".join(strings), IntSuspects)
+
+def suspect_strings(strings):
+    text = "\t".join(strings)
+    if not text.isascii():
+        # Every item is a whitespace free word only if split() gives them back
+        return text.split() != strings
+    return "" in strings or has_any(text, AsciiBlanks)
+
+SuspectChecks = {float: suspect_floats, int: suspect_ints,
+                 str: suspect_strings}
+
+def parse_schema(schema):
+    ''' Schema may be a string like "t: float, N(W): float, Algorithm: str",
+        a dict {field: type} or a sequence of types or (field, type) pairs.
+        Types may be given either as Python types or as SchemaTypes names.
+        Returns the list of (field, type) pairs, field is None
+        for the positional entries
+    '''
+    def schema_type(data_type):
+        if isinstance(data_type, str):
+            try:
+                data_type = SchemaTypes[data_type.strip()]
+            except KeyError:
+                raise FieldError("Unknown schema type {t:s}".format(
+                                 t = data_type))
+        if data_type not in TypeConverters:
+            raise FieldError("Unsupported schema type {t:s}".format(
+                             t = str(data_type)))
+        return data_type
+
+    if schema == AUTO_SCHEMA:
+        return list()
+    if isinstance(schema, str):
+        entries = list()
+        for entry in schema.split(","):
+            field, separator, data_type = entry.rpartition(":")
+            entries.append((field.strip() if separator else None, data_type))
+    elif isinstance(schema, dict):
+        entries = list(schema.items())
+    else:
+        entries = [entry if isinstance(entry, tuple) else (None, entry)
+                   for entry in schema]
+    return [(field, schema_type(data_type)) for field, data_type in entries]
+
+def split_columns(text, first_line_no, n_fields, data_file_name):
+    ''' Splits the text of tab separated lines into n_fields columns
+        of strings. Returns the columns and the line numbers of
+        the records (blank lines are skipped).
+        If every line has the same number of tabs the whole chunk
+        is split at once and the columns are just the slices
+        of the flat list of cells.
+    '''
+    text = text.replace("\r", "")
+    if text.endswith("\n"):
+        text = text[:-1]
+    lines = text.split("\n")
+    line_nos = range(first_line_no, first_line_no + len(lines))
+    if (n_fields > 1 and
+        set(map(str.count, lines, itertools.repeat("\t"))) == {n_fields - 1}):
+        cells = text.replace("\n", "\t").split("\t")
+        return [cells[n::n_fields] for n in range(n_fields)], line_nos
+
+    records = [line.split("\t") for line in lines]
+    if [""] in records:
+        line_nos = [n for n, rec in zip(line_nos, records) if rec != [""]]
+        records = [rec for rec in records if rec != [""]]
+    for rec, line_no in zip(records, line_nos):
+        if len(rec) != n_fields:
+            raise fields_mismatch(data_file_name, line_no, n_fields, len(rec))
+    if len(records) == 0:
+        return [list() for n in range(n_fields)], line_nos
+    return [list(column) for column in zip(*records)], line_nos
+
+def convert_columns(columns, line_nos, data_types, data_file_name):
+    ''' Converts the columns of strings into lists of typed values
+        calling the converter directly for the whole column,
+        the items are matched by TypePatterns only if the converter
+        fails or the column has suspect items (see SuspectChecks)
+    '''
+    values = list()
+    for strings, data_type in zip(columns, data_types):
+        converter = TypeConverters[data_type]
+        match = TypePatterns[data_type].match
+        suspect = SuspectChecks.get(data_type)
+        try:
+            # The strings are kept as they are
+            column = strings if data_type is str else list(map(converter, strings))
+            if suspect is None:
+                if not all(map(match, strings)):
+                    raise ValueError
+            elif suspect(strings):
+                raise ValueError
+        except ValueError:
+            for data_string, line_no in zip(strings, line_nos):
+                try:
+                    if match(data_string) is None:
+                        raise ValueError
+                    converter(data_string)
+                except ValueError:
+                    raise parse_error(data_file_name, line_no, data_string)
+        values.append(column)
+    return values
+
+# Interpolation modes and extrapolation policies of TInterpolator
+LINEAR = "linear"
+LOG_LINEAR = "loglinear"
+EXTRAPOLATE = "linear"      # continue the first/last segment
+CLIP = "clip"               # hold the first/last record values
+NAN = "nan"                 # NaN outside the table
+RAISE = "raise"             # FieldError outside the table
+
+def as_float_array(values, data_type = float):
+    ''' Numeric or datetime (as POSIX seconds) values as float64 array
+    '''
+    if data_type is datetime.datetime or isinstance(values, datetime.datetime):
+        values = np.asarray(values, dtype = "datetime64[us]")
+    else:
+        values = np.asarray(values)
+        if values.dtype == object:
+            values = values.astype("datetime64[us]")
+    if np.issubdtype(values.dtype, np.datetime64):
+        return values.astype("datetime64[us]").astype(np.int64) / 1e6
+    return values.astype(np.float64)
+
+class TInterpolator(object):
+    ''' Interpolation table: the records are sorted by the argument field
+        once, then the brackets of any number of query values are
+        found by binary search (np.searchsorted) in one call.
+        Every numeric and datetime field is interpolated, datetimes
+        are handled as POSIX seconds.
+    '''
+    def __init__(self, reader, field, mode = LINEAR,
+                 extrapolation = EXTRAPOLATE):
+        if mode not in (LINEAR, LOG_LINEAR):
+            raise FieldError("Unknown interpolation mode " + str(mode))
+        if extrapolation not in (EXTRAPOLATE, CLIP, NAN, RAISE):
+            raise FieldError("Unknown extrapolation policy " +
+                             str(extrapolation))
+        field_index = reader.find_field_index(field)
+        if reader.data_types[field_index] is str:
+            raise FieldError(("Can't interpolate on {fld:s} " +
+                             "field of string type").format(fld = str(field)))
+        if len(reader) < 2:
+            raise FieldError("At least two records are needed to interpolate")
+        self.mode = mode
+        self.extrapolation = extrapolation
+        # Indexes of the interpolated fields
+        self.field_indexes = [n for n, data_type in enumerate(reader.data_types)
+                              if data_type is not str]
+        self.data_types = [reader.data_types[n] for n in self.field_indexes]
+
+        if reader.columns is not None:
+            columns = [reader.columns[n] for n in self.field_indexes]
+        else:
+            columns = [[rec[n] for rec in reader.raw_data]
+                       for n in self.field_indexes]
+        x = as_float_array(columns[self.field_indexes.index(field_index)],
+                           reader.data_types[field_index])
+        order = np.argsort(x, kind = "stable")
+        self.x = x[order]
+        self.y = np.column_stack([as_float_array(column, data_type)
+                                  for column, data_type in zip(
+                                      columns, self.data_types)])[order]
+        if mode == LOG_LINEAR:
+            with np.errstate(divide = "ignore", invalid = "ignore"):
+                self.log_y = np.log(self.y)
+
+    def column_no(self, field, reader):
+        ''' Column of the interpolate() result for the reader's field
+        '''
+        return self.field_indexes.index(reader.find_field_index(field))
+
+    def interpolate(self, values):
+        ''' Returns array of shape (len(values), len(self.field_indexes)),
+            or just a row for a scalar value.
+            In LOG_LINEAR mode the logarithm of the data is interpolated
+            where both bracket values are positive, elsewhere the linear
+            interpolation is used. Its EXTRAPOLATE values far outside
+            the table may overflow to inf without a warning.
+        '''
+        x = as_float_array(values)
+        scalar = (x.ndim == 0)
+        x = np.atleast_1d(x)
+        outside = (x < self.x[0]) | (x > self.x[-1])
+        if self.extrapolation == RAISE and outside.any():
+            raise FieldError("Value {v} is out of the [{lo}, {hi}] range".format(
+                             v = x[outside][0], lo = self.x[0], hi = self.x[-1]))
+        if self.extrapolation == CLIP:
+            x = np.clip(x, self.x[0], self.x[-1])
+
+        idx = np.clip(np.searchsorted(self.x, x, side = "right"),
+                      1, len(self.x) - 1)
+        x0 = self.x[idx - 1]
+        dx = self.x[idx] - x0
+        k = np.divide(x - x0, dx, out = np.zeros_like(x), where = dx != 0)
+        k = k[:, np.newaxis]
+        y0 = self.y[idx - 1]
+        y1 = self.y[idx]
+        result = y0 + k * (y1 - y0)
+        if self.mode == LOG_LINEAR:
+            log_y0 = self.log_y[idx - 1]
+            log_y1 = self.log_y[idx]
+            positive = (y0 > 0.0) & (y1 > 0.0)
+            with np.errstate(over = "ignore", invalid = "ignore"):
+                log_result = np.exp(log_y0 + k * (log_y1 - log_y0))
+            result = np.where(positive, log_result, result)
+        if self.extrapolation == NAN:
+            result[outside] = np.nan
+        return result[0] if scalar else result
+
+    __call__ = interpolate
+
 class TDataReader(object):
 
-    def __init__(self, data_file_name):
+    def __init__(self, data_file_name, columnar = False, schema = None):
         """ Reads data file trying to understand fields
-            names and data types
+            names and data types.
+            If columnar is True every field is kept as a typed
+            NumPy array (see self.columns) and raw_data is
+            a read-only view built over them.
+            If schema is given (see parse_schema(), AUTO_SCHEMA to guess
+            everything from the first data line) the file is read by
+            the typed parser converting the whole columns at once,
+            such a reader can also follow the file growth by refresh().
         """
 
         # This is a local function for line parsing
@@ -43,68 +497,9 @@ class TDataReader(object):
             fields_list = re.split(field_pattern, line)[:-1]
             return fields_list
 
-        # This is a local function for first line parsing
-        # wich expected to be field names
-        def parse_first_line(record):
-            string_pattern = re.compile(r"^[^0-9]\S*$")
-            fields = record
-            if not all(string_pattern.match(field) is not None
-                       for field in fields):
-                fields = list()
-            return fields
-
         # This is a local function for data line parsing
         def parse_data_line(record):
-            string_pattern = re.compile(
-                r"""^(?P<string>\S+)$""")
-            int_number_pattern = re.compile(
-                r"""^(?P<number>[-+]?[0-9]+)$""")
-            float_number_pattern = re.compile(
-                r"""^(?P<number>                   # To create symbolic group
-                      [-+]?[0-9]*[.]?[0-9]+        # Mantissa part
-                      ([eE][-+]?[0-9]+)?)$         # Optional exponent
-                """, re.VERBOSE)
-            datetime_pattern = re.compile(
-                r"""^(?P<day>[0-9]{1,2})[.]        # Day
-                     (?P<month>[0-9]{2})[.]        # Month
-                     (?P<year>[0-9]{4})[ ]         # Year
-                     (?P<hour>[0-9]{1,2})[:]       # Hours
-                     (?P<min>[0-9]{2})[:]          # Minutes
-                     (?P<sec>[0-9]{2})$            # Seconds
-                 """, re.VERBOSE)
-
-            data_tuple = tuple()
-
-            for data_string in record:
-                int_num_match   = int_number_pattern.match(data_string)
-                float_num_match = float_number_pattern.match(data_string)
-                datetime_match  = datetime_pattern.match(data_string)
-                string_match    = string_pattern.match(data_string)
-                # int matching is disabled for a while
-                # because float is good enough
-                #if int_num_match is not None:
-                #    data_value = int(int_num_match.group("number"))
-                if float_num_match is not None:
-                    data_value = float(float_num_match.group("number"))
-                elif datetime_match is not None:
-                    day     = int(datetime_match.group("day"))
-                    month   = int(datetime_match.group("month"))
-                    year    = int(datetime_match.group("year"))
-                    hours   = int(datetime_match.group("hour"))
-                    minutes = int(datetime_match.group("min"))
-                    seconds = int(datetime_match.group("sec"))
-                    data_value = datetime.datetime(
-                        year = year, month = month, day = day,
-                        hour = hours, minute = minutes, second = seconds,
-                        microsecond = 0)
-                elif string_match is not None:
-                    data_value = str(string_match.group("string"))
-                else:
-                    raise IncorrectFileFormat(data_file_name, line_no,
-                                              "error parsing " + data_string)
-                data_tuple += (data_value,)
-
-            return data_tuple
+            return parse_data_record(record, data_file_name, line_no)
 
         # This is a local function for data line type checking
         # against theinstanse's self.data_types tuple.
@@ -113,9 +508,8 @@ class TDataReader(object):
         # is extended accordingly
         def check_data_type(data_tuple):
             if (len(data_tuple) > len(self.fields)) and (len(self.fields) > 0):
-                raise IncorrectFileFormat(data_file_name, line_no,
-                        "{fld_no:d} fields but {vals:d} data values ".format(
-                            fld_no = len(self.fields), vals = len(data_tuple)))
+                raise fields_mismatch(data_file_name, line_no,
+                                      len(self.fields), len(data_tuple))
             if len(data_tuple) > len(self.data_types):
                 # Add new data types
                 for data_item in itertools.islice(data_tuple,
@@ -130,43 +524,116 @@ class TDataReader(object):
                                            exp = str(data_type)))
 
 
+        # Columnar mode needs rectangular data
+        def check_columnar_row(data_tuple):
+            if (len(self.data_types) > 0 and
+                len(data_tuple) != len(self.data_types)):
+                raise fields_mismatch(data_file_name, line_no,
+                                      len(self.data_types), len(data_tuple))
+
+        # Moves the buffered records into the column chunks
+        def flush_columns():
+            if len(self.raw_data) > 0:
+                column_chunks.append([make_column(list(values), data_type)
+                                      for values, data_type in zip(
+                                          zip(*self.raw_data), self.data_types)])
+            self.raw_data = list()
+
         # This is __init__ function itself body
+        self.init_attributes(data_file_name, schema)
+        column_chunks = list()
+        if schema is not None:
+            # Typed reading by chunks
+            self.stream = TDataStream(data_file_name, schema)
+            self.fields = self.stream.fields
+            self.data_types = self.stream.data_types
+            for values in self.stream.iter_chunks(as_arrays = columnar):
+                if columnar:
+                    column_chunks.append(values)
+                else:
+                    self.raw_data.extend(zip(*values))
+            self.data_lines = self.stream.data_lines
+            self.file_state = self.stream.file_state()
+        else:
+            with open(file=data_file_name,
+                      mode='r',
+                      encoding='utf8') as data_file_object:
+                line_no = 1
+
+                # Skip the comment lines
+                check_comment = True
+                while check_comment:
+                    first_line = data_file_object.readline()
+                    line_no += 1
+                    if not first_line.startswith("#"):
+                        check_comment = False
+                        line_no -=1
+                        break
+
+                # Analyze the first meaningful line first :-)
+                record = parse_line(first_line)
+                self.fields = parse_header(record)
+                data_lines = data_file_object
+                if len(self.fields) > 0:
+                    line_no += 1
+                else:
+                    # First line contains ordinary data
+                    data_lines = itertools.chain((first_line,), data_file_object)
+
+                for line in data_lines:
+                    record = parse_line(line)
+                    data_tuple = parse_data_line(record)
+                    if columnar:
+                        check_columnar_row(data_tuple)
+                    check_data_type(data_tuple)
+                    self.raw_data.append(data_tuple)
+                    line_no += 1
+                    self.data_lines += 1
+                    if columnar and len(self.raw_data) >= COLUMNAR_CHUNK:
+                        flush_columns()
+
+        if columnar:
+            flush_columns()
+            self.columns = [concatenate_columns(
+                               [chunk[n] for chunk in column_chunks], data_type)
+                            for n, data_type in enumerate(self.data_types)]
+            self.raw_data = TColumnarRows(self.columns)
+
+    def init_attributes(self, data_file_name, schema):
         self.fields = list()
         self.data_types = tuple()
         self.data_lines = int(0)
         self.raw_data = list()
-        with open(file=data_file_name,
-                  mode='r',
-                  encoding='utf8') as data_file_object:
-            line_no = 1
-
-            # Skip the comment lines
-            check_comment = True
-            while check_comment:
-                file_pos = data_file_object.tell()
-                first_line = data_file_object.readline()
-                line_no += 1
-                if not first_line.startswith("#"):
-                    check_comment = False
-                    line_no -=1
-                    break
-
-            # Analyze the first meaningful line first :-)
-            record = parse_line(first_line)
-            self.fields = parse_first_line(record)
-            if len(self.fields) > 0:
-                line_no += 1
-            else:
-                # First line contains ordinary data
-                data_file_object.seek(file_pos)
+        self.columns = None
+        # Lazy lookup indexes, see get_index()
+        self.indexes = dict()
+        # Cached interpolation tables, see get_interpolator()
+        self.interpolators = dict()
+        self.data_file_name = data_file_name
+        self.schema = schema
+        # The typed parser stream and the file state after the last
+        # read, see refresh()
+        self.stream = None
+        self.file_state = None
 
-            for line in data_file_object:
-                record = parse_line(line)
-                data_tuple = parse_data_line(record)
-                check_data_type(data_tuple)
-                self.raw_data.append(data_tuple)
-                line_no += 1
-                self.data_lines += 1
+    @classmethod
+    def from_columns(cls, data_file_name, fields, data_types, columns,
+                     columnar = False, schema = None):
+        ''' Reader over the already parsed columns (see make_column()),
+            the file itself is not read
+        '''
+        reader = cls.__new__(cls)
+        reader.init_attributes(data_file_name, schema)
+        reader.fields = list(fields)
+        reader.data_types = tuple(data_types)
+        if len(columns) > 0:
+            reader.data_lines = len(columns[0])
+        if columnar:
+            reader.columns = list(columns)
+            reader.raw_data = TColumnarRows(reader.columns)
+        else:
+            reader.raw_data = list(zip(*(column.tolist() for column in columns)))
+        return reader
 
     def find_field_index(self, field):
         if type(field) is str:
@@ -184,30 +651,142 @@ class TDataReader(object):
 
     def sort_data(self, field):
         field_index = self.find_field_index(field)
-        self.raw_data.sort(key = lambda x: x[field_index])
+        if self.columns is not None:
+            key_column = self.columns[field_index]
+            if isinstance(key_column, TCategoryColumn):
+                key_column = np.array(key_column.categories)[key_column.codes]
+            order = np.argsort(key_column, kind = "stable")
+            self.columns[:] = [column[order] for column in self.columns]
+        else:
+            self.raw_data.sort(key = lambda x: x[field_index])
+        self.drop_indexes()
 
-    def interpolate_by_field(self, field, field_data):
+    def refresh(self):
+        ''' Brings the data up to date with the file which is only
+            appended to (like the core history): the lines added after
+            the previous read are parsed and appended to the data.
+            If the file was truncated or rewritten it is reread
+            completely. Only the readers created with a schema can be
+            refreshed. Returns the number of records read.
+        '''
+        if self.stream is None:
+            raise DataReaderException("Only typed reader can be refreshed")
+        stream = self.stream
+        if self.file_state == stream.file_state():
+            return 0
+        if (not stream.is_appended(self.file_state) or
+            len(self.data_types) == 0):
+            self.__init__(self.data_file_name,
+                          columnar = self.columns is not None,
+                          schema = self.schema)
+            return len(self)
+
+        chunks = list(stream.iter_chunks(as_arrays = self.columns is not None,
+                                         start_offset = stream.end_offset,
+                                         start_line_no = stream.end_line_no))
+        if len(chunks) > 0:
+            if self.columns is not None:
+                self.columns[:] = [concatenate_columns(
+                                       [column] + [chunk[n] for chunk in chunks],
+                                       data_type)
+                                   for n, (column, data_type) in enumerate(
+                                       zip(self.columns, self.data_types))]
+            else:
+                for values in chunks:
+                    self.raw_data.extend(zip(*values))
+            self.drop_indexes()
+        self.data_lines += stream.data_lines
+        self.file_state = stream.file_state()
+        return stream.data_lines
+
+    def get_column(self, field):
+        ''' Typed NumPy array (TCategoryColumn for strings)
+            with the field values. In the ordinary mode the column
+            is built from raw_data and kept as the indexes are.
+        '''
         field_index = self.find_field_index(field)
-        if self.data_types[field_index] is str:
-            raise FieldError(("Can't interpolate on {fld:s} " +
-                             "field of string type").format(fld = field))
+        if self.columns is not None:
+            return self.columns[field_index]
+        index_key = (field_index, "column")
+        column = self.indexes.get(index_key)
+        if column is None:
+            column = make_column([rec[field_index] for rec in self.raw_data],
+                                 self.data_types[field_index])
+            self.indexes[index_key] = column
+        return column
 
-        self.sort_data(field)
-        for idx in range(len(self.raw_data)):
-            if field_data < self.raw_data[idx][field_index]: break
-        if idx == 0: idx = 1
+    def get_dense_index(self, field):
+        ''' NumPy array of the record numbers indexed by the values
+            of the non-negative integer field, -1 for the missing values.
+            As for get_index() the first record with the value wins.
+        '''
+        field_index = self.find_field_index(field)
+        index_key = (field_index, "dense")
+        index = self.indexes.get(index_key)
+        if index is None:
+            values = np.asarray(self.get_column(field_index), dtype = np.int64)
+            index = np.full(values.max() + 1 if len(values) > 0 else 0, -1,
+                            dtype = np.int64)
+            unique_values, first_rec_nos = np.unique(values, return_index = True)
+            index[unique_values] = first_rec_nos
+            self.indexes[index_key] = index
+        return index
 
-        prev_field = self.raw_data[idx-1][field_index]
-        next_field = self.raw_data[idx][field_index]
-        prev_data = self.raw_data[idx-1]
-        next_data = self.raw_data[idx]
+    def get_index(self, field, unique = True):
+        ''' Returns the dictionary field value -> record for the field.
+            The index is built on the first request and kept until
+            the data is reordered (see drop_indexes()).
+            For unique index the first record with the value wins
+            (as the linear search did), otherwise the values are lists
+            of all the records with the value in raw_data order.
+        '''
+        field_index = self.find_field_index(field)
+        index_key = (field_index, bool(unique))
+        index = self.indexes.get(index_key)
+        if index is None:
+            index = dict()
+            if unique:
+                for rec in self.raw_data:
+                    index.setdefault(rec[field_index], rec)
+            else:
+                for rec in self.raw_data:
+                    index.setdefault(rec[field_index], list()).append(rec)
+            self.indexes[index_key] = index
+        return index
 
-        k = (field_data - prev_field) / (next_field - prev_field)
-        value = [(prev_data_item + k * (next_data_item - prev_data_item))
-                 if type(prev_data_item) is not str else 'string!'
-                 for (prev_data_item, next_data_item) in zip(
-                      prev_data, next_data)]
+    def drop_indexes(self):
+        ''' Must be called whenever raw_data is changed in place
+        '''
+        self.indexes.clear()
+        self.interpolators.clear()
 
+    def get_interpolator(self, field, mode = LINEAR,
+                         extrapolation = EXTRAPOLATE):
+        ''' TInterpolator over the field, built once and kept
+            until the data is changed (see drop_indexes())
+        '''
+        key = (self.find_field_index(field), mode, extrapolation)
+        interpolator = self.interpolators.get(key)
+        if interpolator is None:
+            interpolator = TInterpolator(self, field, mode, extrapolation)
+            self.interpolators[key] = interpolator
+        return interpolator
+
+    def interpolate_by_field(self, field, field_data):
+        ''' Record interpolated at field == field_data, the first or
+            the last segment is continued outside of the data range.
+            Strings are replaced by 'string!'
+        '''
+        interpolator = self.get_interpolator(field)
+        row = iter(interpolator.interpolate(field_data).tolist())
+        value = list()
+        for data_type in self.data_types:
+            if data_type is str:
+                value.append('string!')
+            elif data_type is datetime.datetime:
+                value.append(np.datetime64(round(next(row) * 1e6), "us").item())
+            else:
+                value.append(next(row))
         return value
 
     def interpolate_by_rec_no(self, rec_no):
@@ -234,25 +813,321 @@ class TDataReader(object):
         return value
 
     def get_item_by_field(self, field_name, field_value):
-        field_index = self.find_field_index(field_name)
-        for rec in self.raw_data:
-            if rec[field_index] == field_value:
-                return rec
-        raise KeyError
+        return self.get_index(field_name)[field_value]
+
+    def get_items_by_field(self, field_name, field_value):
+        return self.get_index(field_name, unique = False).get(
+                                                field_value, list())
 
     def __len__(self):
         return len(self.raw_data)
 
     def __contains__(self, RegZone):
-        field_index = self.find_field_index(RegZoneField)
-        for rec in self.raw_data:
-            if rec[field_index] == RegZone:
-                return True
-        return False
+        return RegZone in self.get_index(RegZoneField)
 
     def __getitem__(self, RegZone):
-        field_index = self.find_field_index(RegZoneField)
-        for rec in self.raw_data:
-            if rec[field_index] == RegZone:
-                return rec
-        raise KeyError
+        return self.get_index(RegZoneField)[RegZone]
+
+class TDataStream(object):
+    ''' Forward-only typed reader of the data files too large to be
+        kept in memory (e.g. power histories logged every second).
+        Comments, header line, schema and type checking are the same
+        as in TDataReader with a schema. Iterating over the stream
+        yields the records one by one, iter_chunks() yields the
+        columns of at most chunk_size lines, so only one chunk is
+        in memory at a time. Every pass rereads the file.
+    '''
+    def __init__(self, data_file_name, schema = AUTO_SCHEMA,
+                 chunk_size = COLUMNAR_CHUNK):
+        self.data_file_name = data_file_name
+        self.chunk_size = chunk_size
+        self.fields = list()
+        self.data_types = tuple()
+        self.data_lines = int(0)    # records yielded by the last pass
+        self.data_offset = 0        # byte offset of the first data line
+        self.data_line_no = 1       # and its number in the file
+        self.end_offset = 0         # byte offset after the last line read
+        self.end_line_no = 1        # and the number of the next line
+        with open(file = data_file_name, mode = 'rb') as data_file_object:
+            self.read_header(data_file_object)
+            declared = self.resolve_schema(schema)
+            data_file_object.seek(self.data_offset)
+            self.guess_data_types(data_file_object, declared)
+
+    find_field_index = TDataReader.find_field_index
+
+    def read_header(self, data_file_object):
+        # Skip the comment lines
+        line = data_file_object.readline()
+        while line.startswith(b"#"):
+            self.data_offset += len(line)
+            self.data_line_no += 1
+            line = data_file_object.readline()
+        # Analyze the first meaningful line
+        record = line.decode("utf8").rstrip("\r\n").split("\t")
+        self.fields = parse_header(record)
+        if len(self.fields) > 0:
+            self.data_offset += len(line)
+            self.data_line_no += 1
+
+    # Field index -> type declared in the schema, the schema
+    # may name the fields of the file without the header line
+    def resolve_schema(self, schema):
+        declared = dict()
+        names = list()
+        for n, (field, data_type) in enumerate(parse_schema(schema)):
+            if field is not None and len(self.fields) > 0:
+                declared[self.find_field_index(field)] = data_type
+            else:
+                declared[n] = data_type
+                names.append(field)
+        if len(self.fields) == 0 and len(names) > 0 and None not in names:
+            self.fields = names
+        return declared
+
+    # Types not declared in the schema are guessed
+    # from the first data line
+    def guess_data_types(self, data_file_object, declared):
+        line_no = self.data_line_no
+        for line in data_file_object:
+            line = line.decode("utf8").rstrip("\r\n")
+            if line != "":
+                break
+            line_no += 1
+        else:
+            self.data_types = tuple(declared[n] for n in sorted(declared))
+            return
+
+        first_record = line.split("\t")
+        n_fields = len(self.fields) or len(first_record)
+        if len(first_record) != n_fields:
+            raise fields_mismatch(self.data_file_name, line_no,
+                                  n_fields, len(first_record))
+        if len(declared) < n_fields:
+            guessed = parse_data_record(first_record,
+                                        self.data_file_name, line_no)
+        self.data_types = tuple(
+            declared[n] if n in declared else type(guessed[n])
+            for n in range(n_fields))
+
+    def iter_chunks(self, as_arrays = False,
+                    start_offset = None, start_line_no = None):
+        ''' Yields lists of values, one list per field, or typed
+            columns (see make_column()) if as_arrays is True.
+            The pass may be started from the byte offset of any line
+            (e.g. self.end_offset of the previous pass).
+            When resuming, an unterminated last line is left
+            for the next pass as it may be still being written.
+        '''
+        resume = start_offset is not None
+        if not resume:
+            start_offset = self.data_offset
+            start_line_no = self.data_line_no
+        self.data_lines = 0
+        self.end_offset = start_offset
+        self.end_line_no = start_line_no
+        with open(file = self.data_file_name, mode = 'rb') as data_file_object:
+            data_file_object.seek(start_offset)
+            line_no = start_line_no
+            while True:
+                byte_lines = list(itertools.islice(data_file_object,
+                                                   self.chunk_size))
+                if resume and len(byte_lines) > 0 and (
+                   not byte_lines[-1].endswith(b"\n")):
+                    byte_lines.pop()
+                if len(byte_lines) == 0:
+                    break
+                data = b"".join(byte_lines)
+                self.end_offset += len(data)
+                self.end_line_no += len(byte_lines)
+                text = data.decode("utf8")
+                columns, line_nos = split_columns(text, line_no,
+                                        len(self.data_types), self.data_file_name)
+                line_no += len(byte_lines)
+                if len(line_nos) == 0:
+                    continue
+                values = convert_columns(columns, line_nos,
+                                         self.data_types, self.data_file_name)
+                self.data_lines += len(line_nos)
+                if as_arrays:
+                    yield [make_column(column, data_type) for column, data_type
+                           in zip(values, self.data_types)]
+                else:
+                    yield values
+
+    def __iter__(self):
+        for values in self.iter_chunks():
+            yield from zip(*values)
+
+    def file_state(self):
+        ''' Size, modification time and the bytes around the parsed data
+            end, so that the appended and the rewritten file can be told
+        '''
+        stat = os.stat(self.data_file_name)
+        tail_start = max(self.data_offset, self.end_offset - TAIL_CHECK_BYTES)
+        with open(file = self.data_file_name, mode = 'rb') as data_file_object:
+            head = data_file_object.read(self.data_offset)
+            data_file_object.seek(tail_start)
+            tail = data_file_object.read(self.end_offset - tail_start)
+        return (stat.st_size, stat.st_mtime_ns, head, tail)
+
+    def is_appended(self, prev_state):
+        ''' True if the file only grew after the complete lines read
+            since prev_state was taken at the same end_offset
+        '''
+        size, mtime, head, tail = self.file_state()
+        prev_size, prev_mtime, prev_head, prev_tail = prev_state
+        return (size >= self.end_offset and
+                head == prev_head and tail == prev_tail and
+                (tail == b"" or tail.endswith(b"\n")))
+
+
+# Binary arrays container of the caches: the magic, the data offset,
+# JSON header with the metadata and the arrays layout, then the raw
+# array data aligned to ARRAYS_ALIGNMENT bytes. The arrays may be read
+# at once or memory mapped without parsing anything but the header.
+ARRAYS_MAGIC = b"TVSARR01"
+ARRAYS_ALIGNMENT = 64
+
+def aligned(offset):
+    return -(-offset // ARRAYS_ALIGNMENT) * ARRAYS_ALIGNMENT
+
+def save_arrays(file_name, meta, arrays):
+    ''' Saves the dictionary of NumPy arrays with the JSON-able meta,
+        the file is replaced atomically
+    '''
+    arrays = {name: np.ascontiguousarray(array)
+              for name, array in arrays.items()}
+    layout = dict()
+    offset = 0
+    for name, array in arrays.items():
+        layout[name] = {"dtype": array.dtype.str, "shape": list(array.shape),
+                        "offset": offset}
+        offset += aligned(array.nbytes)
+    header = json.dumps({"meta": meta, "arrays": layout}).encode("utf8")
+    data_start = aligned(len(ARRAYS_MAGIC) + 8 + len(header))
+    header = header.ljust(data_start - len(ARRAYS_MAGIC) - 8)
+    os.makedirs(os.path.dirname(file_name) or os.curdir, exist_ok = True)
+    temp_fn = file_name + ".tmp"
+    with open(file = temp_fn, mode = 'wb') as file_object:
+        file_object.write(ARRAYS_MAGIC)
+        file_object.write(data_start.to_bytes(8, "little"))
+        file_object.write(header)
+        for name, array in arrays.items():
+            file_object.seek(data_start + layout[name]["offset"])
+            file_object.write(array.tobytes())
+        file_object.truncate(data_start + offset)
+    os.replace(temp_fn, file_name)
+
+def load_arrays(file_name, use_mmap = False):
+    ''' Returns the meta and the arrays saved by save_arrays(),
+        the arrays are read-only np.memmap views if use_mmap is set
+    '''
+    with open(file = file_name, mode = 'rb') as file_object:
+        if file_object.read(len(ARRAYS_MAGIC)) != ARRAYS_MAGIC:
+            raise ValueError(f"{file_name} is not an arrays file")
+        data_start = int.from_bytes(file_object.read(8), "little")
+        header = json.loads(file_object.read(
+                     data_start - len(ARRAYS_MAGIC) - 8).decode("utf8"))
+        data = None if use_mmap else bytearray(file_object.read())
+    arrays = dict()
+    for name, layout in header["arrays"].items():
+        dtype = np.dtype(layout["dtype"])
+        shape = tuple(layout["shape"])
+        if use_mmap:
+            arrays[name] = np.memmap(file_name, dtype = dtype, mode = 'r',
+                                     offset = data_start + layout["offset"],
+                                     shape = shape)
+        else:
+            arrays[name] = np.frombuffer(data, dtype = dtype,
+                                         count = math.prod(shape),
+                                         offset = layout["offset"]
+                                         ).reshape(shape)
+    return header["meta"], arrays
+
+
+# Parsed data cache.
+# Every data file has its own arrays file in the cache directory
+# named by the file path hash, it keeps the typed columns and
+# the file size, mtime and content hash they were parsed from.
+# The cache directory is created when the first cache file is named.
+
+def cache_file_name(data_file_name, schema, cache_dir, extension = ".arr"):
+    os.makedirs(cache_dir, exist_ok = True)
+    key = json.dumps([os.path.abspath(data_file_name), str(schema)])
+    key_hash = hashlib.sha1(key.encode("utf8")).hexdigest()[:16]
+    base_name = os.path.splitext(os.path.basename(data_file_name))[0]
+    return os.path.join(cache_dir, f"{base_name}_{key_hash}{extension}")
+
+def file_hash(file_name):
+    with open(file = file_name, mode = 'rb') as file_object:
+        return hashlib.sha256(file_object.read()).hexdigest()
+
+def save_columns_cache(cache_fn, meta, data_types, columns):
+    arrays = dict()
+    categories = dict()
+    for n, (column, data_type) in enumerate(zip(columns, data_types)):
+        if data_type is str:
+            arrays[f"codes{n}"] = column.codes
+            categories[n] = column.categories
+        else:
+            arrays[f"column{n}"] = column
+    save_arrays(cache_fn, dict(meta, categories = categories), arrays)
+
+def load_columns_cache(cache_fn):
+    meta, arrays = load_arrays(cache_fn)
+    data_types = [SchemaTypes[type_name] for type_name in meta["types"]]
+    columns = list()
+    for n, data_type in enumerate(data_types):
+        if data_type is str:
+            categories = [sys.intern(category)
+                          for category in meta["categories"][str(n)]]
+            columns.append(TCategoryColumn(arrays[f"codes{n}"], categories))
+        else:
+            columns.append(arrays[f"column{n}"])
+    del meta["categories"]
+    return meta, data_types, columns
+
+def read_cached(data_file_name, schema = AUTO_SCHEMA, columnar = False,
+                cache_dir = CreateCacheDir.CacheDir):
+    ''' TDataReader for the data file parsed by the typed parser,
+        the parsed columns are kept in the binary cache, so the text
+        is parsed only when the file changes. The cache entry is valid
+        if the file has the same size and mtime, or the same content
+        (e.g. after the checkout).
+    '''
+    cache_fn = cache_file_name(data_file_name, schema, cache_dir)
+    stat = os.stat(data_file_name)
+    content_hash = None
+    try:
+        meta, data_types, columns = load_columns_cache(cache_fn)
+        if meta["version"] == CACHE_VERSION and meta["size"] == stat.st_size:
+            valid = (meta["mtime"] == stat.st_mtime_ns)
+            if not valid:
+                content_hash = file_hash(data_file_name)
+                valid = (meta["hash"] == content_hash)
+                if valid:
+                    meta["mtime"] = stat.st_mtime_ns
+                    save_columns_cache(cache_fn, meta, data_types, columns)
+            if valid:
+                return TDataReader.from_columns(data_file_name,
+                                                meta["fields"], data_types,
+                                                columns, columnar, schema)
+    except (OSError, KeyError, ValueError):
+        # No cache entry yet or it is unreadable
+        pass
+
+    if content_hash is None:
+        content_hash = file_hash(data_file_name)
+    reader = TDataReader(data_file_name, columnar = True, schema = schema)
+    type_names = {data_type: name for name, data_type in SchemaTypes.items()}
+    meta = {"version": CACHE_VERSION, "size": stat.st_size,
+            "mtime": stat.st_mtime_ns, "hash": content_hash,
+            "fields": reader.fields,
+            "types": [type_names[data_type] for data_type in reader.data_types]}
+    save_columns_cache(cache_fn, meta, reader.data_types, reader.columns)
+    if columnar:
+        return reader
+    return TDataReader.from_columns(data_file_name, reader.fields,
+                                    reader.data_types, reader.columns,
+                                    schema = schema)
@@ -1,83 +1,72 @@
 #!/usr/bin/env python3
 
+import CreateCacheDir
+import DataReader
+import FINReader
 import m_print
-import datetime, re, os, string, math
+import datetime, re, os, string, math, hashlib, json
+import collections, concurrent.futures
+import numpy as np
 
 TIME_FORMAT = '%d.%m.%Y %H:%M:%S'
 
 MCUGreenDirName = "TVS_Green"
+# Source spans of the Green functions, TVS_Green/TVS_1..5
+GreenSrcSpans = range(1,6)
+# Format version of the Green functions cache, see read_cached_greens()
+GREEN_CACHE_VERSION = 1
+# Format version of the dose kernel cache, see TDoseKernel.read_cached()
+DOSE_KERNEL_VERSION = 2
+
+# ORIGEN bands out of the Green functions source energies range,
+# see OrigenRebinMatrix()
+REBIN_DROP = "drop"         # the band intensity is not taken into account
+REBIN_CLIP = "clip"         # it goes to the nearest source energy
+REBIN_RAISE = "raise"       # FAGammaException
+ORIGEN_REBIN_OUTSIDE = REBIN_DROP
+
+# Max number of the reg zone spectra kept by TGreenLibrary,
+# 5 spans x 20 source energies x 50 zones is the whole library
+GREEN_LIBRARY_SPECTRA = 5000
+
+# Number of processes parsing the Green functions FIN files
+# in readGreenFuncs(), 1 parses them one after another in this process
+GREEN_READ_WORKERS = 1
+
+FINFileTemplate = re.compile(
+    r"""^TVS_N.FIN_S
+        (?P<finno>[0-9]+)$
+     """, re.VERBOSE)
+STAFileTemplate = re.compile(
+    r"""^EMES
+        \s+                          # Any number of spaces
+        (?P<number>                  # To create symbolic group
+        [-+]?[0-9]*[.]?[0-9]+        # Mantissa part
+        ([eE][-+]?[0-9]+)?)$
+     """, re.VERBOSE)
 
 # Structure is a series of nested dictionaries as
 # Greens[1..5] key is where the source is, values are
 #  IncGamma[Esrc] key is the source gamma-quantum energy, eV, values are
 #   RegZones[100..149] key is MCU reg zone, values are
 #    Fluxes[E] key is dissipated quantum energy, eV, values are fluxes, p/cm2*sec
+#
+# TGreenTensor keeps the same values as the dense array
+# G[src_span, E_src, reg_zone, E_reg], see below
 
-def ReadFIN(fn):
-    def ParseDataLine(line):
-        clear_line = line.strip(string.whitespace)
-        separators = re.compile(r"\s+")
-        val_str = separators.split(clear_line)
-        try:
-            vals = [float(v) for v in val_str]
-        except ValueError:
-            vals = None
-        return vals
-
-    def ParseZoneLine(line):
-        line_pattern = re.compile(
-        r"""ZONE:
-              \s+                          # Any number of spaces
-             (?P<zone>[0-9]+)              # Integer Zone no
-        """, re.VERBOSE)
-        num_match = line_pattern.search(line)
-        if num_match is not None:
-            zone = int(num_match.group("zone"))
-        else:
-            zone = None
-        return zone
-
-    def AddFluxLine(vals):
-        E = vals[0]
-        Flux = vals[1]
-        Fluxes[E] = Flux
-
-
-    Flag1 = "-- ZONES --"
-    Flag2 = "FLUX"
-    Flag3 = "Energy"
-    Flag4 = "-- OBJECTS --"
-    Lines2Find = 3
+def ReadFIN(fn, zones = None):
+    # Reg zones spectra are the FLUX tallies of the first ZONES section,
+    # if zones are given only the spectra of these reg zones are read
+    selection = {"flux": dict(section = "ZONES", kind = FINReader.FluxKind,
+                              key = "Energy")}
+    accept = None if zones is None else (lambda block: block.zone in zones)
+    tallies = FINReader.read_tallies(fn, selection, accept = accept)["flux"]
     RegZones = dict()
-    Fluxes = dict()
-    with open(file = fn, mode='r', encoding='utf8') as FINfileObject:
-        finLineNo = 0
-        for finLine in FINfileObject:
-            finLineNo += 1
-            if finLine.strip(string.whitespace).startswith(Flag1):
-                Lines2Find -= 1
-                continue
-            if (Lines2Find == 2 and
-                finLine.strip(string.whitespace).startswith(Flag2)):
-                Lines2Find -= 1
-                zone = ParseZoneLine(finLine)
-                continue
-            if (Lines2Find == 1 and
-                finLine.strip(string.whitespace).startswith(Flag3)):
-                Lines2Find -= 1
-                continue
-            if Lines2Find == 0:
-                #m_print.m_print(f"Reading spectrum, line no = {finLineNo}")
-                values = ParseDataLine(finLine)
-                if values is None:
-                    # Finished reading sources for particular zone
-                    Lines2Find = 2
-                    RegZones[zone] = Fluxes
-                    Fluxes = dict()
-                else:
-                    AddFluxLine(values)
-            if finLine.strip(string.whitespace).startswith(Flag4):
-                break
+    for tally in tallies:
+        if tally.block.section_no != tallies[0].block.section_no:
+            break
+        if tally.block.zone is not None:
+            RegZones[tally.block.zone] = tally.as_dict()
 
     # Now we have to divide MCU "fluxes" into reg zones volumes
     # to get the values in "p/cm2*sec" units
@@ -94,21 +83,12 @@ def ReadFIN(fn):
             RegZones[zone][E] /= ZoneVolume
     return RegZones
 
-def readFINsDir(dir_name):
-    IncGamma = dict()
+def GreenFiles(dir_name):
+    ''' [(FIN file, STA parameters file)] of the Green functions
+        directory in the os.listdir() order
+    '''
+    files = list()
     folder = os.path.join(os.curdir, MCUGreenDirName, dir_name)
-    FINFileTemplate = re.compile(
-        r"""^TVS_N.FIN_S
-            (?P<finno>[0-9]+)$
-         """, re.VERBOSE)
-    STAFileTemplate = re.compile(
-        r"""^EMES
-            \s+                          # Any number of spaces
-            (?P<number>                  # To create symbolic group
-            [-+]?[0-9]*[.]?[0-9]+        # Mantissa part
-            ([eE][-+]?[0-9]+)?)$
-         """, re.VERBOSE)
-
     for filename in os.listdir(folder):
         f = os.path.join(folder, filename)
         fin_match = FINFileTemplate.match(filename)
@@ -116,23 +96,461 @@ def readFINsDir(dir_name):
             fin_no = int(fin_match.group("finno"))
             param_fn = f"STA{fin_no:08d}"
             fp = os.path.join(folder, param_fn)
-            with open(file = fp, mode='rt', encoding='cp1251') as param_file_object:
-                for pl in param_file_object:
-                    param_match = STAFileTemplate.match(pl)
-                    if param_match is not None:
-                        break
-            Esrc = float(param_match.group("number"))
-            # print(filename, fin_no, Esrc)
-            regZones = ReadFIN(f)
-            IncGamma[Esrc] = regZones
+            files.append((f, fp))
+    return files
+
+def ReadGreenFile(files):
+    ''' (Esrc, RegZones) of the FIN file and its STA parameters file
+    '''
+    f, fp = files
+    Esrc = ReadSourceEnergy(fp)
+    # print(f, Esrc)
+    return Esrc, ReadFIN(f)
+
+def ReadSourceEnergy(fp):
+    ''' Source gamma-quantum energy (EMES) of the STA parameters file, eV
+    '''
+    with open(file = fp, mode='rt', encoding='cp1251') as param_file_object:
+        for pl in param_file_object:
+            param_match = STAFileTemplate.match(pl)
+            if param_match is not None:
+                break
+    return float(param_match.group("number"))
+
+def readFINsDir(dir_name):
+    IncGamma = dict()
+    for files in GreenFiles(dir_name):
+        Esrc, regZones = ReadGreenFile(files)
+        IncGamma[Esrc] = regZones
     return IncGamma
 
-def readGreenFuncs():
+def readGreenFuncs(workers = None):
+    ''' Greens of all the source spans, the FIN files are parsed by
+        workers processes (GREEN_READ_WORKERS by default)
+    '''
+    if workers is None:
+        workers = GREEN_READ_WORKERS
+    span_files = {src: GreenFiles(f"TVS_{src:1d}") for src in GreenSrcSpans}
+    all_files = [files for src in GreenSrcSpans for files in span_files[src]]
+    if workers > 1 and len(all_files) > 1:
+        # The files are independent, the results are assembled
+        # in the same order as they are read one after another
+        with concurrent.futures.ProcessPoolExecutor(
+                max_workers = min(workers, len(all_files))) as executor:
+            parsed = iter(list(executor.map(ReadGreenFile, all_files)))
+    else:
+        parsed = map(ReadGreenFile, all_files)
     Greens = dict()
-    for src in range(1,6):
-        dir_name = f"TVS_{src:1d}"
-        IncGamma = readFINsDir(dir_name)
+    for src in GreenSrcSpans:
+        IncGamma = dict()
+        for files in span_files[src]:
+            Esrc, regZones = next(parsed)
+            IncGamma[Esrc] = regZones
         Greens[src] = IncGamma
     return Greens
+
+def GreenSourceFiles():
+    ''' [path, size, mtime] of all the FIN and STA files
+        the Green functions are read from
+    '''
+    sources = list()
+    for src in GreenSrcSpans:
+        for files in sorted(GreenFiles(f"TVS_{src:1d}")):
+            for fn in files:
+                stat = os.stat(fn)
+                sources.append([fn, stat.st_size, stat.st_mtime_ns])
+    return sources
+
+def read_cached_greens(cache_dir = CreateCacheDir.CacheDir, use_mmap = True,
+                       workers = None):
+    ''' TGreenTensor of the Green functions from the binary cache.
+        The cache is rebuilt by readGreenFuncs(workers) if any of the FIN and STA
+        files is added, removed or changed (by size or mtime). With
+        use_mmap the tensor is the read-only np.memmap, so the processes
+        reading the same cache share its pages.
+    '''
+    cache_fn = DataReader.cache_file_name(os.path.join(os.curdir, MCUGreenDirName),
+                                          "Green functions", cache_dir)
+    sources = GreenSourceFiles()
+    try:
+        meta, arrays = DataReader.load_arrays(cache_fn, use_mmap)
+        if (meta["version"] == GREEN_CACHE_VERSION and
+            meta["sources"] == sources):
+            return TGreenTensor.from_arrays(meta, arrays)
+    except (OSError, KeyError, TypeError, ValueError):
+        # No cache yet or it is unreadable
+        pass
+
+    m_print.m_print(f"Green functions cache {cache_fn} is rebuilt")
+    tensor = TGreenTensor.from_greens(readGreenFuncs(workers))
+    meta, arrays = tensor.as_arrays()
+    DataReader.save_arrays(cache_fn, dict(meta, version = GREEN_CACHE_VERSION,
+                                          sources = sources), arrays)
+    if use_mmap:
+        meta, arrays = DataReader.load_arrays(cache_fn, use_mmap)
+        tensor = TGreenTensor.from_arrays(meta, arrays)
+    return tensor
         
 
+
+
+class FAGammaException(Exception):
+    pass
+
+
+class TGreenLibrary(object):
+    ''' Lazy Green functions. The tensor of read_cached_greens() is
+        memory mapped when it is first used, the Greens of the reg zones
+        are its slice G[:, :, zone_nos, :]. The slices are kept by the
+        zones, the same zones get the same TGreenTensor. The least recently
+        used slices are dropped when there are more than max_spectra reg
+        zone spectra in the slices kept.
+        Usage:
+            library = TGreenLibrary()
+            Greens = library.greens(range(130,150))
+    '''
+    def __init__(self, max_spectra = GREEN_LIBRARY_SPECTRA,
+                 cache_dir = CreateCacheDir.CacheDir):
+        self.max_spectra = max_spectra
+        self.cache_dir = cache_dir
+        self.tensor = None
+        self.slices = collections.OrderedDict()
+        self.spectra = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.slices)
+
+    def full_tensor(self):
+        if self.tensor is None:
+            self.tensor = read_cached_greens(self.cache_dir)
+        return self.tensor
+
+    def greens(self, zones):
+        ''' TGreenTensor of all the source spans restricted to the reg
+            zones, it may be used instead of the readGreenFuncs() Greens
+            if only these zones are needed
+        '''
+        key = tuple(sorted(zones))
+        if key in self.slices:
+            self.hits += 1
+            self.slices.move_to_end(key)
+            return self.slices[key]
+
+        self.misses += 1
+        tensor = self.full_tensor()
+        try:
+            zone_nos = [tensor.zone_nos[zone] for zone in key]
+        except KeyError as ex:
+            raise FAGammaException(f"No Green functions of the reg zone {ex.args[0]}")
+        G = np.ascontiguousarray(tensor.G[:, :, zone_nos, :])
+        self.slices[key] = TGreenTensor(tensor.src_spans, tensor.E_srcs, key,
+                                        tensor.E_regs, G, tensor.E_src_orders)
+        self.spectra += G.shape[0] * G.shape[1] * G.shape[2]
+        while self.spectra > self.max_spectra and len(self.slices) > 1:
+            _, dropped = self.slices.popitem(last = False)
+            self.spectra -= dropped.G.shape[0] * dropped.G.shape[1] * dropped.G.shape[2]
+        return self.slices[key]
+
+    def clear(self):
+        self.slices.clear()
+        self.spectra = 0
+        self.tensor = None
+
+
+class TGreenTensor(object):
+    ''' Green functions as the contiguous array
+            G[src_span, E_src, reg_zone, E_reg]
+        src_spans are the source spans 1..5, E_srcs and E_regs are
+        the sorted energy axes, zones are the sorted reg zones and
+        zone_nos is {reg zone: index in zones}. The values missing
+        in the Greens dictionaries are zeros.
+
+        Reg zone is 10*remoteness + height, the zones make the grid
+        remotenesses x heights, so G_grid is the view of G as
+            G_grid[src_span, E_src, remoteness, height, E_reg]
+        and mirror is the view of the spans 6..10 (not a copy):
+            mirror[src_span - 6] == G_grid[10 - src_span, :, :, ::-1]
+        The FA has FA_spans = 2*len(src_spans) spans, they are
+        the reg zones heights too.
+    '''
+    last = None
+
+    def __init__(self, src_spans, E_srcs, zones, E_regs, G, E_src_orders = None):
+        self.src_spans = list(src_spans)
+        self.E_srcs = np.asarray(E_srcs, dtype = np.float64)
+        self.zones = list(zones)
+        self.E_regs = np.asarray(E_regs, dtype = np.float64)
+        self.G = G
+        # Greens dictionaries of the same values if they are known, see of()
+        self.source = None
+        # digest() of G, it is not changed after the tensor is made
+        self.hex_digest = None
+        # Source energies of every span in the order they were read,
+        # greens() restores the dictionaries in this order
+        if E_src_orders is None:
+            E_src_orders = [self.E_srcs.tolist()] * len(self.src_spans)
+        self.E_src_orders = [list(order) for order in E_src_orders]
+        self.src_span_nos = {span: n for n, span in enumerate(self.src_spans)}
+        self.E_src_nos = {E: n for n, E in enumerate(self.E_srcs.tolist())}
+        self.zone_nos = {zone: n for n, zone in enumerate(self.zones)}
+        self.E_reg_nos = {E: n for n, E in enumerate(self.E_regs.tolist())}
+        self.FA_spans = 2*len(self.src_spans)
+        self.remotenesses = sorted({zone // 10 for zone in self.zones})
+        self.heights = sorted({zone % 10 for zone in self.zones})
+        grid = [10*remoteness + height for remoteness in self.remotenesses
+                                       for height in self.heights]
+        if grid != self.zones:
+            raise FAGammaException(f"Reg zones {self.zones} are not the grid "
+                                   "of remotenesses and heights")
+        self.G_grid = G.reshape(G.shape[:2] + (len(self.remotenesses),
+                                               len(self.heights)) + G.shape[3:])
+        self.mirror = self.G_grid[::-1, :, :, ::-1]
+
+    @classmethod
+    def from_greens(cls, Greens, dtype = np.float64):
+        ''' Greens are the nested dictionaries of readGreenFuncs(),
+            dtype may be np.float32 to halve the memory
+        '''
+        src_spans = sorted(Greens)
+        E_srcs = sorted({Esrc for src in Greens for Esrc in Greens[src]})
+        zones = sorted({zone for src in Greens for Esrc in Greens[src]
+                             for zone in Greens[src][Esrc]})
+        E_regs = sorted({E for src in Greens for Esrc in Greens[src]
+                           for zone in Greens[src][Esrc]
+                           for E in Greens[src][Esrc][zone]})
+        E_reg_nos = {E: n for n, E in enumerate(E_regs)}
+        G = np.zeros((len(src_spans), len(E_srcs), len(zones), len(E_regs)),
+                     dtype = dtype)
+        for span_no, src in enumerate(src_spans):
+            for E_src_no, Esrc in enumerate(E_srcs):
+                RegZones = Greens[src].get(Esrc, {})
+                for zone_no, zone in enumerate(zones):
+                    Fluxes = RegZones.get(zone, {})
+                    E_reg_no = [E_reg_nos[E] for E in Fluxes]
+                    G[span_no, E_src_no, zone_no, E_reg_no] = list(Fluxes.values())
+        tensor = cls(src_spans, E_srcs, zones, E_regs, G,
+                     [list(Greens[src]) for src in src_spans])
+        tensor.source = Greens
+        return tensor
+
+    @classmethod
+    def of(cls, Greens, dtype = np.float64):
+        ''' The tensor is built once for the Greens dictionaries
+            and rebuilt only if other Greens are passed. Greens may be
+            the tensor itself, e.g. the one of read_cached_greens()
+        '''
+        if isinstance(Greens, cls):
+            tensor = Greens
+        else:
+            tensor = cls.last
+            if tensor is None or tensor.source is not Greens:
+                tensor = cls.from_greens(Greens, dtype)
+        tensor = tensor.astype(dtype)
+        cls.last = tensor
+        return tensor
+
+    @classmethod
+    def from_arrays(cls, meta, arrays):
+        ''' Tensor of the meta and arrays of as_arrays()
+        '''
+        return cls(meta["src_spans"], arrays["E_srcs"], meta["zones"],
+                   arrays["E_regs"], arrays["G"], meta["E_src_orders"])
+
+    def as_arrays(self):
+        ''' The meta and arrays to be saved by DataReader.save_arrays()
+        '''
+        meta = {"src_spans": self.src_spans, "zones": self.zones,
+                "E_src_orders": self.E_src_orders}
+        return meta, {"G": self.G, "E_srcs": self.E_srcs, "E_regs": self.E_regs}
+
+    def span(self, src_span):
+        ''' G_grid[E_src, remoteness, height, E_reg] of the source
+            at the FA span 1..FA_spans, the view for every span
+        '''
+        if src_span in self.src_span_nos:
+            return self.G_grid[self.src_span_nos[src_span]]
+        mirror_span = 1 + self.FA_spans - src_span
+        if mirror_span in self.src_span_nos:
+            return self.G_grid[self.src_span_nos[mirror_span], :, :, ::-1]
+        raise FAGammaException(f"No Green functions of the span {src_span}")
+
+    def digest(self):
+        ''' Hash of the axes and values of the tensor
+        '''
+        if self.hex_digest is None:
+            axes = json.dumps([self.src_spans, self.E_srcs.tolist(), self.zones,
+                               self.E_regs.tolist(), self.G.dtype.str])
+            tensor_hash = hashlib.sha256(axes.encode("utf8"))
+            tensor_hash.update(np.ascontiguousarray(self.G).data)
+            self.hex_digest = tensor_hash.hexdigest()
+        return self.hex_digest
+
+    def astype(self, dtype):
+        if self.G.dtype == dtype:
+            return self
+        tensor = type(self)(self.src_spans, self.E_srcs, self.zones,
+                            self.E_regs, self.G.astype(dtype), self.E_src_orders)
+        tensor.source = self.source
+        return tensor
+
+    def greens(self):
+        ''' Back to the nested dictionaries of readGreenFuncs() for the
+            callers which still need them. They are the copy of the whole
+            tensor, it is built on the first call only
+        '''
+        if self.source is None:
+            E_regs = self.E_regs.tolist()
+            G = self.G.tolist()
+            self.source = {src: {Esrc: {zone: dict(zip(E_regs,
+                                                G[span_no][self.E_src_nos[Esrc]][zone_no]))
+                                 for zone_no, zone in enumerate(self.zones)}
+                          for Esrc in self.E_src_orders[span_no]}
+                    for span_no, src in enumerate(self.src_spans)}
+        type(self).last = self
+        return self.source
+
+
+def NRBWeights(E_regs, NRB):
+    ''' Weights w[E_reg] of the reg zone spectrum to get the dose rate,
+        Sv/s per p/cm2*sec. NRB is {E_NRB: photon flux per 1e-12 Sv},
+        the coefficient of E_NRB goes to the upper bound of every
+        registered energies interval Elow <= E_NRB <= EHigh.
+    '''
+    weights = np.zeros(len(E_regs), dtype = np.float64)
+    for E_NRB, NRB_value in NRB.items():
+        for n in range(1, len(E_regs)):
+            if E_regs[n-1] <= E_NRB <= E_regs[n]:
+                weights[n] += NRB_value * 1e-12
+    return weights
+
+def OrigenRebinMatrix(E_srcs, bands, outside = REBIN_DROP):
+    ''' R[band, E_src] is the part of the ORIGEN band (Emin, Emax)
+        intensity emitted by the Green functions source energy E_src,
+        E_srcs are sorted.
+        The band is shared by the source energies Emin <= E_src <= Emax,
+        every energy takes the part of the band nearer to it than to the
+        other energies inside the band (the band with one energy inside
+        goes to this energy completely). The band without energies inside
+        is split between the neighbouring energies E_lo < E_hi by the
+        linear interpolation at the band center. The band out of the source
+        energies range is dropped (REBIN_DROP), goes to the nearest source
+        energy (REBIN_CLIP) or raises FAGammaException (REBIN_RAISE).
+    '''
+    E_srcs = np.asarray(E_srcs, dtype = np.float64)
+    R = np.zeros((len(bands), len(E_srcs)), dtype = np.float64)
+    for band_no, (Emin, Emax) in enumerate(bands):
+        inside = np.flatnonzero((Emin <= E_srcs) & (E_srcs <= Emax))
+        if len(inside) == 1 or (len(inside) > 1 and Emax <= Emin):
+            R[band_no, inside] = 1.0 / len(inside)
+        elif len(inside) > 1:
+            # Band parts between the midpoints of the energies inside
+            edges = np.concatenate(([Emin], 0.5*(E_srcs[inside[1:]] +
+                                                 E_srcs[inside[:-1]]), [Emax]))
+            R[band_no, inside] = np.diff(edges) / (Emax - Emin)
+        else:
+            E_center = 0.5*(Emin + Emax)
+            hi = np.searchsorted(E_srcs, E_center)
+            if 0 < hi < len(E_srcs):
+                E_lo, E_hi = E_srcs[hi-1], E_srcs[hi]
+                R[band_no, hi-1] = (E_hi - E_center) / (E_hi - E_lo)
+                R[band_no, hi] = (E_center - E_lo) / (E_hi - E_lo)
+            elif outside == REBIN_CLIP:
+                R[band_no, min(hi, len(E_srcs) - 1)] = 1.0
+            elif outside == REBIN_RAISE:
+                raise FAGammaException(f"ORIGEN band ({Emin}, {Emax}) is out "
+                                       f"of the source energies {E_srcs.tolist()}")
+    return R
+
+
+class TDoseKernel(object):
+    ''' Dose rate kernel
+            D[src_span, band, reg_zone]
+        is the dose rate in the reg zone, Sv/s, per the source of 1/s
+        intensity of the ORIGEN energy band in the source span. This is
+        the Green functions collapsed with the NRB weights over the
+        registered energies and with the ORIGEN rebinning matrix over the
+        source energies, see OrigenRebinMatrix(). It doesn't depend on
+        the FA and its history.
+        The spans above src_spans are the mirror images as in TGreenTensor.
+    '''
+    last = None
+
+    def __init__(self, src_spans, bands, zones, D, key):
+        self.src_spans = list(src_spans)
+        self.bands = [tuple(band) for band in bands]
+        self.zones = list(zones)
+        self.D = D
+        self.key = key
+        self.FA_spans = 2*len(self.src_spans)
+        self.zone_nos = {zone: n for n, zone in enumerate(self.zones)}
+
+    @classmethod
+    def build(cls, tensor, NRB, bands, key = None):
+        weights = NRBWeights(tensor.E_regs.tolist(), NRB)
+        # Dose rate per source quantum of every source energy
+        K = np.einsum('sezr,r->sez', tensor.G, weights, dtype = np.float64)
+        R = OrigenRebinMatrix(tensor.E_srcs, bands, ORIGEN_REBIN_OUTSIDE)
+        D = np.einsum('be,sez->sbz', R, K)
+        if key is None:
+            key = kernel_key(tensor, NRB, bands)
+        return cls(tensor.src_spans, bands, tensor.zones, D, key)
+
+    @classmethod
+    def read_cached(cls, tensor, NRB, bands, cache_dir = CreateCacheDir.CacheDir):
+        ''' Kernel from the cache if it was built of the same Green
+            functions, NRB weights and ORIGEN bands, the kernel of the
+            previous call is returned if they are the same. Every key has
+            its own cache file, so the kernels of other reg zones or bands
+            don't overwrite each other
+        '''
+        key = kernel_key(tensor, NRB, bands)
+        if cls.last is not None and cls.last.key == key:
+            return cls.last
+        cache_fn = DataReader.cache_file_name(os.path.join(os.curdir, MCUGreenDirName),
+                                              ["dose kernel", key], cache_dir)
+        kernel = None
+        try:
+            meta, arrays = DataReader.load_arrays(cache_fn)
+            if meta["version"] == DOSE_KERNEL_VERSION and meta["key"] == key:
+                kernel = cls(meta["src_spans"], meta["bands"], meta["zones"],
+                             arrays["D"], key)
+        except (OSError, KeyError, TypeError, ValueError):
+            # No cache yet or it is unreadable
+            pass
+        if kernel is None:
+            kernel = cls.build(tensor, NRB, bands, key)
+            DataReader.save_arrays(cache_fn, {"version": DOSE_KERNEL_VERSION,
+                                              "key": key,
+                                              "src_spans": kernel.src_spans,
+                                              "bands": kernel.bands,
+                                              "zones": kernel.zones},
+                                   {"D": kernel.D})
+        cls.last = kernel
+        return kernel
+
+    def dose(self, S, zones):
+        ''' dose[zone, t], Sv/s, of the reg zones list. S[FA_span, band, t]
+            are the ORIGEN spectra of the FA spans 0..len(S)-1 in the bands
+            order. The span FA_span >= len(S) // 2 is the mirror image of the
+            span len(S)-1-FA_span, the reg zone height is mirrored too.
+        '''
+        FA_spans = len(S)
+        half = FA_spans // 2
+        if FA_spans - half > len(self.src_spans):
+            raise FAGammaException(f"No Green functions of {FA_spans} FA spans")
+        zone_nos = [self.zone_nos[zone] for zone in zones]
+        mirror_nos = [self.zone_nos[10 * (zone // 10) + (FA_spans - zone % 10 - 1)]
+                      for zone in zones]
+        mirror_spans = [FA_spans - 1 - FA_span for FA_span in range(half, FA_spans)]
+        return (np.einsum('sbz,sbt->zt', self.D[:half][:, :, zone_nos], S[:half]) +
+                np.einsum('sbz,sbt->zt', self.D[mirror_spans][:, :, mirror_nos],
+                          S[half:]))
+
+def kernel_key(tensor, NRB, bands):
+    ''' Hash of everything the dose kernel is built of
+    '''
+    key = json.dumps([DOSE_KERNEL_VERSION, tensor.digest(), sorted(NRB.items()),
+                      [list(band) for band in bands], ORIGEN_REBIN_OUTSIDE])
+    return hashlib.sha256(key.encode("utf8")).hexdigest()
@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+
+import DataReader
+import CreateCacheDir
+import FileScanner
+import re, os, json
+import numpy as np
+
+# MCU .FIN output is a sequence of sections started with the lines like
+# " -- ZONES --". Tally sections consist of the tally blocks:
+#
+#  NUCLIDE:          MIXT, REACTION:            3, ENERGY:    0.00000E+00
+#          Zone          Mean        StdDev
+#             1   1.51522E-01   9.10091E-02
+#             ...
+#
+# or " FLUX.  ENERGY: ..." / " FLUX.  ZONE: ..." blocks of the same shape.
+# Every block is the title line, the column header line and the lines
+# of three numbers up to the first line of other kind.
+#
+# Usage:
+#   tallies = read_tallies(fn, {"R3": dict(section = "ZONES", nuclide = "MIXT",
+#                                          reaction = 3),
+#                               "flux": dict(kind = FluxKind, key = "Energy")})
+#   for tally in tallies["flux"]:
+#       spectrum = tally.as_dict()
+
+# Format version of the FIN index files, see TFINIndex.load()
+FIN_INDEX_VERSION = 2
+
+# Kinds of the tally blocks
+NuclideKind = "NUCLIDE"
+FluxKind = "FLUX"
+# Table key columns of the integer numbers
+IntegerKeys = ("Zone", "Object")
+
+# Markers are searched as "\n " prefixed strings, so the regular
+# expression engine may skip to the line starts quickly (the first
+# line of the .FIN file is never a marker)
+FINMarkersPattern = re.compile(
+    rb"""\n[ ](?:--[ ](?P<section>[A-Z][A-Z ]*?)[ ]--      # Section start
+       |(?P<title>                                      # Block title
+          NUCLIDE:\s*(?P<nuclide>[^,\n]*?)\s*,
+                  \s*REACTION:\s*(?P<reaction>[-+]?[0-9]+)\s*,
+                  \s*ENERGY:\s*(?P<energy>[-+0-9.eE]+)
+         |FLUX\.\s+(?:ENERGY:\s*(?P<flux_energy>[-+0-9.eE]+)
+                     |ZONE:\s*(?P<zone>[0-9]+))
+          )[ \t]*\r?\n
+          [ \t]*(?P<key>[^ \t\n]*)[^\n]*\n                  # Column header
+        )
+    """, re.VERBOSE)
+
+# Any number of the lines of three numbers. The values are checked
+# when the lines are parsed, here only the table end is found.
+FINTablePattern = re.compile(
+    rb"(?:[ \t]+[-+0-9.eE]+[ \t]+[-+0-9.eE]+[ \t]+[-+0-9.eE]+[ \t]*\r?\n)*")
+
+
+class FINReaderException(Exception):
+    pass
+
+class FINBlockNotFound(FINReaderException):
+    def __init__(self, fn, criteria):
+        self.fn = fn
+        self.criteria = criteria
+
+    def __str__(self):
+        return f"Tally block {self.criteria} was not found in {self.fn}"
+
+
+class TFINBlock(object):
+    ''' Tally block position: the section it belongs to and the section
+        number in the file, the block title values, the name of the table
+        key column ("Zone" or "Energy"), byte offsets of the first table
+        line and of the table end and the number of the table lines
+    '''
+    fields = ("section", "section_no", "kind", "title", "nuclide", "reaction",
+              "energy", "zone", "key", "offset", "end", "lines")
+
+    def __init__(self, section, section_no, kind, title, nuclide, reaction,
+                 energy, zone, key, offset, end, lines):
+        self.section = section
+        self.section_no = section_no
+        self.kind = kind
+        self.title = title
+        self.nuclide = nuclide
+        self.reaction = reaction
+        self.energy = energy
+        self.zone = zone
+        self.key = key
+        self.offset = offset
+        self.end = end
+        self.lines = lines
+
+    def as_list(self):
+        return [getattr(self, field) for field in type(self).fields]
+
+    def matches(self, criteria):
+        ''' criteria is the dictionary of the fields values,
+            None values match anything
+        '''
+        return all(value is None or getattr(self, field) == value
+                   for field, value in criteria.items())
+
+
+class TTally(object):
+    ''' Decoded tally block: keys are zones or objects (int64) or
+        energies (float64) of the table lines, means and stdevs
+        are float64 arrays
+    '''
+    def __init__(self, block, table):
+        self.block = block
+        if block.key in IntegerKeys:
+            self.keys = table[:, 0].astype(np.int64)
+        else:
+            self.keys = table[:, 0]
+        self.means = table[:, 1]
+        self.stdevs = table[:, 2]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def as_dict(self):
+        ''' {key: mean} in the table order
+        '''
+        return dict(zip(self.keys.tolist(), self.means.tolist()))
+
+
+class TFINIndex(object):
+    ''' Byte offsets of all the tally blocks of the .FIN file.
+        The index is built once by the file scan and kept in the cache
+        directory, it is valid while the file size and mtime are the same.
+    '''
+    def __init__(self, fn, size, mtime, blocks):
+        self.fn = fn
+        self.size = size
+        self.mtime = mtime
+        self.blocks = blocks
+
+    @classmethod
+    def build(cls, fn, scanner = None):
+        stat = os.stat(fn)
+        if scanner is None:
+            with FileScanner.TFileScanner(fn) as scanner:
+                blocks = scan_blocks(scanner)
+        else:
+            blocks = scan_blocks(scanner)
+        return cls(fn, stat.st_size, stat.st_mtime_ns, blocks)
+
+    @classmethod
+    def load(cls, fn, cache_dir = CreateCacheDir.CacheDir, scanner = None):
+        ''' Returns the valid index of the file, from the cache if possible.
+            The scanner of the file already opened may be passed.
+        '''
+        index_fn = index_file_name(fn, cache_dir)
+        stat = os.stat(fn)
+        try:
+            with open(file = index_fn, mode = 'r', encoding = 'utf8') as index_file_object:
+                stored = json.load(index_file_object)
+            if (stored["version"] == FIN_INDEX_VERSION and
+                stored["size"] == stat.st_size and
+                stored["mtime"] == stat.st_mtime_ns):
+                blocks = [TFINBlock(*block) for block in stored["blocks"]]
+                return cls(fn, stat.st_size, stat.st_mtime_ns, blocks)
+        except (OSError, KeyError, TypeError, ValueError):
+            # No index yet or it is unreadable
+            pass
+
+        index = cls.build(fn, scanner)
+        index.save(index_fn)
+        return index
+
+    def save(self, index_fn):
+        stored = {"version": FIN_INDEX_VERSION,
+                  "size": self.size, "mtime": self.mtime,
+                  "fields": TFINBlock.fields,
+                  "blocks": [block.as_list() for block in self.blocks]}
+        temp_fn = index_fn + ".tmp"
+        with open(file = temp_fn, mode = 'w', encoding = 'utf8') as index_file_object:
+            json.dump(stored, index_file_object)
+        os.replace(temp_fn, index_fn)
+
+    def find_blocks(self, section = None, nuclide = None, reaction = None,
+                    energy = None, zone = None, **criteria):
+        ''' All the blocks matching the given TFINBlock fields values
+        '''
+        criteria.update(section = section, nuclide = nuclide,
+                        reaction = reaction, energy = energy, zone = zone)
+        return [block for block in self.blocks if block.matches(criteria)]
+
+    def find_block(self, section = None, nuclide = None, reaction = None,
+                   energy = None, zone = None, **criteria):
+        ''' The first block matching the given TFINBlock fields values
+        '''
+        criteria.update(section = section, nuclide = nuclide,
+                        reaction = reaction, energy = energy, zone = zone)
+        for block in self.blocks:
+            if block.matches(criteria):
+                return block
+        raise FINBlockNotFound(self.fn, {field: value for field, value
+                                         in criteria.items() if value is not None})
+
+    def read_block(self, block):
+        ''' Table lines of the block, the rest of the file is not read
+        '''
+        with FileScanner.TFileScanner(self.fn) as scanner:
+            return scanner.decode(block.offset, block.end
+                                  ).splitlines(keepends = True)
+
+    def read_table(self, block):
+        ''' Table of the block as the (lines, 3) float64 array
+        '''
+        with FileScanner.TFileScanner(self.fn) as scanner:
+            return decode_table(scanner.read(block.offset, block.end))
+
+
+def read_tallies(fn, selections, cache_dir = CreateCacheDir.CacheDir,
+                 accept = None):
+    ''' Reads all the selected tally blocks of the .FIN file at once.
+        selections is {name: criteria} where criteria is the dictionary
+        of TFINBlock fields values, see TFINIndex.find_blocks().
+        accept(block) may reject more blocks, they are not decoded.
+        Returns {name: list of TTally} in the file order.
+    '''
+    with FileScanner.TFileScanner(fn) as scanner:
+        index = TFINIndex.load(fn, cache_dir, scanner)
+        tallies = dict()
+        for name, criteria in selections.items():
+            tallies[name] = [TTally(block, decode_table(scanner.read(block.offset,
+                                                                     block.end)))
+                             for block in index.find_blocks(**criteria)
+                             if accept is None or accept(block)]
+    return tallies
+
+def index_file_name(fn, cache_dir):
+    return DataReader.cache_file_name(fn, "FIN index", cache_dir, ".idx.json")
+
+def scan_blocks(scanner):
+    ''' Finds all the tally blocks in the .FIN file, scanner is
+        FileScanner.TFileScanner of the file
+    '''
+    blocks = list()
+    section = None
+    section_no = -1
+    for marker in scanner.finditer(FINMarkersPattern):
+        if marker.group("section") is not None:
+            section = marker.group("section").decode('utf8')
+            section_no += 1
+            continue
+        offset = marker.end()
+        end = scanner.match(FINTablePattern, offset).end()
+        if marker.group("nuclide") is not None:
+            kind = NuclideKind
+            nuclide = marker.group("nuclide").decode('utf8')
+            reaction = int(marker.group("reaction"))
+            energy = float(marker.group("energy"))
+            zone = None
+        else:
+            kind = FluxKind
+            nuclide = None
+            reaction = None
+            energy = marker.group("flux_energy")
+            energy = None if energy is None else float(energy)
+            zone = marker.group("zone")
+            zone = None if zone is None else int(zone)
+        blocks.append(TFINBlock(section, section_no, kind,
+                                " ".join(marker.group("title").decode('utf8').split()),
+                                nuclide, reaction, energy, zone,
+                                marker.group("key").decode('utf8'),
+                                offset, end, scanner.count_lines(offset, end)))
+    return blocks
+
+def decode_table(data):
+    ''' Converts the bytes of the table lines of three numbers
+        into the (lines, 3) float64 array at once. If there is
+        a malformed line the table ends before it, as it did when
+        the tables were parsed line by line.
+    '''
+    tokens = data.split()
+    if len(tokens) % 3 == 0:
+        try:
+            return np.array(tokens, dtype = np.float64).reshape(-1, 3)
+        except ValueError:
+            pass
+    rows = list()
+    for line in data.splitlines():
+        values = line.split()
+        if len(values) != 3:
+            break
+        try:
+            rows.append([float(value) for value in values])
+        except ValueError:
+            break
+    return np.array(rows, dtype = np.float64).reshape(-1, 3)
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+
+import mmap
+
+# Memory mapped text file scanner. The section markers are found
+# by bytes.find() or bytes regular expressions right in the mapped file,
+# only the slices which are really parsed are decoded to str.
+
+class TFileScanner(object):
+    ''' Usage:
+            with TFileScanner(fn) as scanner:
+                pos = scanner.find(b"marker")
+                for line in scanner.iter_lines(scanner.next_line(pos)):
+                    ...
+    '''
+    def __init__(self, fn, encoding = 'utf8'):
+        self.fn = fn
+        self.encoding = encoding
+        self.file_object = open(file = fn, mode = 'rb')
+        try:
+            self.data = mmap.mmap(self.file_object.fileno(), 0,
+                                  access = mmap.ACCESS_READ)
+        except ValueError:
+            # Empty file can't be mapped
+            self.data = b""
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.data = b""
+        self.file_object.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self.data)
+
+    def find(self, marker, start = 0, end = None):
+        ''' Offset of the marker bytes or -1
+        '''
+        if end is None:
+            end = len(self.data)
+        return self.data.find(marker, start, end)
+
+    def next_line(self, pos):
+        ''' Offset of the line following the line with pos
+        '''
+        line_end = self.data.find(b"\n", pos)
+        return len(self.data) if line_end == -1 else line_end + 1
+
+    def view(self, start, end):
+        ''' Zero-copy view of the file bytes, it must be released
+            before the scanner is closed
+        '''
+        return memoryview(self.data)[start:end]
+
+    def read(self, start, end):
+        return self.data[start:end]
+
+    def decode(self, start, end):
+        return str(self.view(start, end), self.encoding)
+
+    def count_lines(self, start, end):
+        return self.data[start:end].count(b"\n")
+
+    def iter_lines(self, start, end = None):
+        ''' Decoded lines (with the line ends) from start up to end
+        '''
+        if end is None:
+            end = len(self.data)
+        while start < end:
+            line_end = self.data.find(b"\n", start, end)
+            line_end = end if line_end == -1 else line_end + 1
+            yield self.decode(start, line_end)
+            start = line_end
+
+    def finditer(self, pattern, start = 0):
+        ''' Matches of the compiled bytes regular expression
+        '''
+        return pattern.finditer(self.data, start)
+
+    def match(self, pattern, pos):
+        return pattern.match(self.data, pos)
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+
+import CreateCacheDir
+import DataReader
+import m_print
+import hashlib, json, os
+import numpy as np
+
+# Parsed ORIGEN results are kept by the hash of the rendered deck text
+# (the template with the history put in) and of the scalerte executable
+# identity, so the same deck is never run twice. Every result is the
+# DataReader arrays file <key>.arr in the cache directory:
+#   bands[n, 2]     ORIGEN band (Emin, Emax), eV
+#   spectra[n, t]   gamma source intensity (1/s) of the band at times t
+# The least recently used results are removed when the files take
+# more than max_bytes. The file mtime is its last use time, so the
+# processes sharing the cache directory share the LRU order too.
+#
+# Usage:
+#   cache = TOrigenCache(scale_bin)
+#   key = cache.key(deck_text)
+#   spectra = cache.get(key)
+#   if spectra is None:
+#       ... run ORIGEN and parse the spectra
+#       cache.put(key, spectra, tregs)
+
+# Format version of the result files
+ORIGEN_CACHE_VERSION = 1
+OrigenCacheDirName = "Origen"
+
+
+class TOrigenCache(object):
+    def __init__(self, scale_bin, max_bytes = 256 * 2**20,
+                 cache_dir = os.path.join(CreateCacheDir.CacheDir, OrigenCacheDirName)):
+        self.scale_id = scale_identity(scale_bin)
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok = True)
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    def key(self, deck_text):
+        deck_hash = hashlib.sha256()
+        deck_hash.update(json.dumps([ORIGEN_CACHE_VERSION, self.scale_id]).encode("utf8"))
+        deck_hash.update(deck_text.encode("utf8"))
+        return deck_hash.hexdigest()
+
+    def file_name(self, key):
+        return os.path.join(self.cache_dir, key + ".arr")
+
+    def get(self, key):
+        ''' {(Emin, Emax): [intensities]} as ParseOrigenOut() fills it
+            or None if there is no such result
+        '''
+        fn = self.file_name(key)
+        try:
+            meta, arrays = DataReader.load_arrays(fn)
+            if meta["version"] != ORIGEN_CACHE_VERSION or meta["key"] != key:
+                raise ValueError(f"{fn} is not the result of {key}")
+            spectra = {tuple(band): values for band, values
+                       in zip(arrays["bands"].tolist(), arrays["spectra"].tolist())}
+            # The result was used just now
+            os.utime(fn)
+        except (OSError, KeyError, TypeError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return spectra
+
+    def put(self, key, spectra, tregs = None):
+        ''' Stores the parsed spectra {(Emin, Emax): [intensities]},
+            tregs are the decay times they are calculated for, hours
+        '''
+        bands = np.array(list(spectra), dtype = np.float64).reshape(-1, 2)
+        values = np.array(list(spectra.values()), dtype = np.float64)
+        DataReader.save_arrays(self.file_name(key),
+                               {"version": ORIGEN_CACHE_VERSION, "key": key,
+                                "scale_id": self.scale_id, "tregs": tregs},
+                               {"bands": bands, "spectra": values})
+        self.stores += 1
+        self.evict()
+
+    def entries(self):
+        ''' [(mtime, size, path)] of the result files, the oldest first
+        '''
+        entries = list()
+        with os.scandir(self.cache_dir) as dir_entries:
+            for entry in dir_entries:
+                if entry.name.endswith(".arr") and entry.is_file():
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        return sorted(entries)
+
+    def evict(self):
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                self.evictions += 1
+            except OSError:
+                # Removed by other process
+                pass
+            total -= size
+
+    def clear(self):
+        for _, _, path in self.entries():
+            os.remove(path)
+
+    def stats(self):
+        entries = self.entries()
+        return {"hits": self.hits, "misses": self.misses, "stores": self.stores,
+                "evictions": self.evictions, "entries": len(entries),
+                "bytes": sum(size for _, size, _ in entries)}
+
+    def report(self):
+        m_print.m_print("Origen cache: " + ", ".join(f"{name} {value}" for name, value
+                                                    in self.stats().items()))
+
+
+def scale_identity(scale_bin):
+    ''' scale_bin with the size and mtime of its executable file,
+        the results of other SCALE version or stub are not used
+    '''
+    if isinstance(scale_bin, (list, tuple)):
+        parts = list(scale_bin)
+    else:
+        parts = [scale_bin]
+    identity = list()
+    for part in parts:
+        try:
+            stat = os.stat(part)
+            identity.append([os.path.abspath(part), stat.st_size, stat.st_mtime_ns])
+        except OSError:
+            identity.append([part])
+    return identity
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+
+import m_print
+import concurrent.futures, os, shutil, subprocess, sys, tempfile
+
+# ORIGEN decks are run by scalerte, every deck in its own process.
+# The independent decks are run concurrently by the pool of threads which
+# only wait for the processes. Every job has its own scratch directory,
+# it is the working directory and TEMP/TMP/TMPDIR of the process, so the
+# SCALE temporary files of the jobs don't collide. scalerte writes .out
+# and .msg files next to the deck as before.
+#
+# Usage:
+#   executor = TOrigenExecutor(scale_bin, workers = 4)
+#   jobs = executor.run(deck_fns, on_done = lambda job: parse(job.out_fn))
+#
+# scale_bin may be a Python script like OrigenStub.py, then it is run
+# by this Python interpreter.
+
+class TOrigenJob(object):
+    ''' ORIGEN run of the deck: exit code, stdout and stderr of scalerte.
+        returncode is None if the process couldn't be started, error
+        is the exception then.
+    '''
+    def __init__(self, deck_fn):
+        self.deck_fn = deck_fn
+        self.name = os.path.splitext(os.path.basename(deck_fn))[0]
+        self.out_fn = os.path.splitext(deck_fn)[0] + ".out"
+        self.returncode = None
+        self.stdout = ""
+        self.stderr = ""
+        self.error = None
+
+    @property
+    def ok(self):
+        return self.returncode == 0
+
+
+def scale_command(scale_bin):
+    ''' Command line prefix of scale_bin, the list of arguments
+        or the path of scalerte or of a Python script. The relative
+        paths of existing files are made absolute, the jobs are run
+        in their scratch directories.
+    '''
+    if isinstance(scale_bin, (list, tuple)):
+        return list(scale_bin)
+    if os.path.isfile(scale_bin):
+        scale_bin = os.path.abspath(scale_bin)
+    if scale_bin.endswith(".py"):
+        return [sys.executable, scale_bin]
+    return [scale_bin]
+
+
+class TOrigenExecutor(object):
+    ''' Runs at most workers ORIGEN jobs at once. Scratch directories are
+        made in scratch_dir (the system temporary directory by default)
+        and removed after the jobs unless keep_scratch is set.
+    '''
+    def __init__(self, scale_bin, workers = 1, scratch_dir = None,
+                 keep_scratch = False):
+        self.command = scale_command(scale_bin)
+        self.workers = max(1, workers)
+        self.scratch_dir = scratch_dir
+        self.keep_scratch = keep_scratch
+
+    def run_job(self, job):
+        scratch = tempfile.mkdtemp(prefix = f"origen_{job.name}_",
+                                   dir = self.scratch_dir)
+        env = dict(os.environ, TEMP = scratch, TMP = scratch, TMPDIR = scratch)
+        try:
+            result = subprocess.run(self.command + [os.path.abspath(job.deck_fn)],
+                                    cwd = scratch, env = env,
+                                    stdout = subprocess.PIPE,
+                                    stderr = subprocess.PIPE,
+                                    encoding = 'utf-8', errors = 'replace')
+            job.returncode = result.returncode
+            job.stdout = result.stdout
+            job.stderr = result.stderr
+        except OSError as ex:
+            job.error = ex
+        finally:
+            if not self.keep_scratch:
+                shutil.rmtree(scratch, ignore_errors = True)
+        return job
+
+    def run(self, deck_fns, on_done = None):
+        ''' Runs the decks and returns their jobs in the deck_fns order.
+            on_done(job) is called in this thread as soon as every job
+            is finished (in the order they finish), failed jobs too.
+        '''
+        jobs = [TOrigenJob(deck_fn) for deck_fn in deck_fns]
+        if self.workers > 1 and len(jobs) > 1:
+            with concurrent.futures.ThreadPoolExecutor(
+                    max_workers = min(self.workers, len(jobs))) as executor:
+                futures = [executor.submit(self.run_job, job) for job in jobs]
+                for future in concurrent.futures.as_completed(futures):
+                    self.finish(future.result(), on_done)
+        else:
+            for job in jobs:
+                self.finish(self.run_job(job), on_done)
+        return jobs
+
+    def finish(self, job, on_done):
+        report_job(job)
+        if on_done is not None:
+            on_done(job)
+
+
+def report_job(job):
+    if job.ok:
+        m_print.m_print(f"Origen was run successfully for {job.deck_fn}")
+    elif job.returncode is None:
+        m_print.m_print(f"Exception while Origen-ing {job.deck_fn}: {job.error}")
+    else:
+        m_print.m_print(f"Exception while Origen-ing {job.deck_fn}")
+        m_print.m_print("Exit status = {}".format(job.returncode))
+        m_print.m_print("scalerte stdout was {}".format(job.stdout))
+        m_print.m_print("scalerte stderr was {}".format(job.stderr))
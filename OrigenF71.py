@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+
+import re, struct
+import numpy as np
+
+# ORIGEN (SCALE 6.2) writes the .f71 file of the cases with save=yes.
+# It is the "ORIGEN_F71" tagged container: the file header and one block
+# per time step (position) of every case. Every block starts with the
+# "TagManager" string and the tag names, then the values follow as
+# tagged items, the type byte first:
+#   0x01 <uint8>, 0x1a <uint8>, 0x04 <float32>, 0x08 <float64>
+#   0x14 <len1> <string>
+#   0x29, 0x31 <len1> <bytes>
+#   0x33 <len1> <float64 * n>   array of len1 bytes
+#   0x34 <len2> <float64 * n>   array of len2 (little endian 16 bit) bytes
+# Only the items needed for the gamma source are decoded. The block head
+# is walked item by item up to the nuclide concentrations array, the case
+# number is the item before it. The gamma items are found after it:
+#   ... 01 <case> 34 <len2> <nuclide concentrations>
+#   ...
+#   33 <len> <gamma bounds, MeV, high to low> 33 <len-8> <gamma source, 1/s>
+#   ...
+#   01 <step> 33 00 04 <time, s> 01 00 08 <float64>
+#   01 <step> 33 00 01 00 01 00 08 <float64>      (time 0)
+#
+# Usage:
+#   spectra = read_gamma_spectra(fn)          # the last case
+#   cases = read_cases_spectra(fn, [2, 4])    # the cases by number
+#   for (Emin, Emax), values in spectra.items(): ...
+
+F71Header = b"ORIGEN_F71"
+BlockMarker = b"\x14\x0aTagManager"
+# Sizes of the block head items, -1 and -2 are the items of 1 and 2 byte length
+HeadItemSizes = {0x01: 1, 0x1a: 1, 0x04: 4, 0x08: 8,
+                 0x14: -1, 0x29: -1, 0x31: -1, 0x33: -1, 0x34: -2}
+ArrayPattern = re.compile(rb"[\x33\x34]", re.DOTALL)
+# The time 0 is written as uint8 item
+TimePattern = re.compile(rb"\x01(.)\x33\x00(?:\x04(.{4})|\x01\x00)\x01\x00\x08", re.DOTALL)
+# The time item is at the end of the block
+TimeTailBytes = 64
+
+
+class OrigenF71Exception(Exception):
+    pass
+
+
+class TF71Position(object):
+    ''' Time step of the case: bounds[n+1] of the gamma groups (MeV,
+        high to low) and gamma source spectrum[n] (1/s) of the groups
+    '''
+    def __init__(self, case, step, time, bounds, spectrum):
+        self.case = case
+        self.step = step
+        self.time = time        # s
+        self.bounds = bounds
+        self.spectrum = spectrum
+
+    @property
+    def hours(self):
+        return self.time / 3600.0
+
+
+def read_array(data, pos):
+    ''' (float64 array, end position) of the array item at pos or None
+    '''
+    if data[pos] == 0x33:
+        size = data[pos+1]
+        start = pos + 2
+    elif data[pos] == 0x34:
+        size = struct.unpack_from('<H', data, pos+1)[0]
+        start = pos + 3
+    else:
+        return None
+    if size % 8 != 0 or start + size > len(data):
+        return None
+    return np.frombuffer(data, dtype = '<f8', count = size // 8, offset = start), start + size
+
+
+def find_gamma(block, start):
+    ''' (bounds, spectrum) of the gamma source items of the block,
+        the bounds are the decreasing positive array followed by
+        the array of one value less
+    '''
+    for match in ArrayPattern.finditer(block, start):
+        bounds = read_array(block, match.start())
+        if bounds is None or len(bounds[0]) < 2:
+            continue
+        bounds, end = bounds
+        if end >= len(block):
+            continue
+        spectrum = read_array(block, end)
+        if spectrum is None or len(spectrum[0]) != len(bounds) - 1:
+            continue
+        if bounds[-1] > 0.0 and np.all(np.diff(bounds) < 0.0):
+            return bounds, spectrum[0]
+    raise OrigenF71Exception("Gamma source is not found")
+
+
+def read_head(block):
+    ''' (case number, end of the nuclide concentrations array)
+    '''
+    pos = 0
+    prev_item = None
+    size_of = HeadItemSizes.get
+    while pos < len(block):
+        item = block[pos]
+        size = size_of(item)
+        if size is None:
+            raise OrigenF71Exception(f"Unknown item type 0x{item:02x} at {pos}")
+        if size == -1:
+            size = 1 + block[pos+1]
+        elif size == -2:
+            size = 2 + struct.unpack_from('<H', block, pos+1)[0]
+        if item == 0x34:
+            if prev_item is None or block[prev_item] != 0x01:
+                break
+            return block[prev_item+1], pos + 1 + size
+        prev_item = pos
+        pos += 1 + size
+    raise OrigenF71Exception("Case number is not found")
+
+
+def read_block(block):
+    case, nuclides_end = read_head(block)
+    # The gamma items are after the nuclide concentrations
+    bounds, spectrum = find_gamma(block, nuclides_end)
+    time_matches = list(TimePattern.finditer(block, max(0, len(block) - TimeTailBytes)))
+    if len(time_matches) == 0:
+        raise OrigenF71Exception("Time is not found")
+    step, time = time_matches[-1].groups()
+    time = 0.0 if time is None else float(struct.unpack('<f', time)[0])
+    return TF71Position(case, step[0], time, bounds, spectrum)
+
+
+def read_data(fn):
+    ''' (file bytes, [(start, end)] of its blocks)
+    '''
+    with open(fn, 'rb') as f71_file_object:
+        data = f71_file_object.read()
+    if data.find(F71Header, 0, 64) == -1:
+        raise OrigenF71Exception(f"{fn} is not ORIGEN .f71 file")
+    starts = [match.start() for match in re.finditer(re.escape(BlockMarker), data)]
+    return data, list(zip(starts, starts[1:] + [len(data)]))
+
+
+def read_position(fn, data, block_no, start, end):
+    try:
+        return read_block(memoryview(data)[start:end])
+    except OrigenF71Exception as ex:
+        raise OrigenF71Exception(f"{fn} position {block_no+1}: {ex}")
+
+
+def read_positions(fn):
+    ''' [TF71Position] of all cases in the file order
+    '''
+    data, blocks = read_data(fn)
+    return [read_position(fn, data, block_no, start, end)
+            for block_no, (start, end) in enumerate(blocks)]
+
+
+def read_last_case(fn):
+    ''' [TF71Position] of the last case, its blocks are read from the file end
+        up to the block of other case
+    '''
+    data, blocks = read_data(fn)
+    positions = list()
+    for block_no in reversed(range(len(blocks))):
+        position = read_position(fn, data, block_no, *blocks[block_no])
+        if len(positions) > 0 and position.case != positions[-1].case:
+            break
+        positions.append(position)
+    return positions[::-1]
+
+
+def band_bound(value):
+    ''' eV as ParseOrigenOut() gets it from the .out table printed "%9.3E" MeV
+    '''
+    return 1e6 * float(f"{value:.3E}")
+
+
+def case_spectra(positions):
+    ''' {(Emin, Emax): [intensities]} of the case positions at its time steps,
+        as ParseOrigenOut() gets them from the .out file
+    '''
+    positions = sorted(positions, key = lambda position: position.step)
+    bounds = positions[0].bounds
+    spectra = np.array([position.spectrum for position in positions]).T
+    return {(band_bound(Emin), band_bound(Emax)): values
+            for Emax, Emin, values in zip(bounds[:-1], bounds[1:], spectra.tolist())}
+
+
+def read_gamma_spectra(fn, case = None):
+    ''' Spectra of the case (the last one by default), see case_spectra()
+    '''
+    if case is None:
+        positions = read_last_case(fn)
+        if len(positions) == 0:
+            raise OrigenF71Exception(f"{fn} has no positions")
+    else:
+        positions = [position for position in read_positions(fn)
+                     if position.case == case]
+        if len(positions) == 0:
+            raise OrigenF71Exception(f"{fn} has no case {case}")
+    return case_spectra(positions)
+
+
+def read_cases_spectra(fn, cases):
+    ''' {case: spectra} of the case numbers of the multi-case deck
+    '''
+    case_positions = {case: list() for case in cases}
+    for position in read_positions(fn):
+        if position.case in case_positions:
+            case_positions[position.case].append(position)
+    for case, positions in case_positions.items():
+        if len(positions) == 0:
+            raise OrigenF71Exception(f"{fn} has no case {case}")
+    return {case: case_spectra(positions) for case, positions in case_positions.items()}
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+
+import math, os, re, sys
+
+# Stand-in for scalerte to run the ORIGEN flow without SCALE:
+#   scale_bin = "OrigenStub.py"
+# For every deck <name>.inp given it writes <name>.out and <name>.msg
+# next to it. The .out file has only the decay cases gamma source tables
+# of the SCALE format for the deck energy bounds and times, every decay
+# case is of the irradiation case before it (multi-case decks too). The intensities
+# are the irradiation energy decaying with a half-life of the band, they
+# depend on the deck but have nothing to do with the real ORIGEN results.
+# The stub writes no .f71 file, the one left by the previous run of the
+# deck is removed, so the .out file is read.
+
+SpectrumTitle = "Gamma source intensity (1/s) as a function of time for case '{}' (#{}/{})"
+ArrayPattern = r"\b{}\s*=\s*\[([^\]]*)\]"
+CasePattern = re.compile(r"\bcase\s*\(\s*(\w+)\s*\)")
+
+def read_array(deck, name):
+    return [[float(value) for value in match.split()]
+            for match in re.findall(ArrayPattern.format(name), deck)]
+
+def read_cases(deck):
+    ''' [(case name, case text)] in the deck order
+    '''
+    matches = list(CasePattern.finditer(deck))
+    ends = [match.start() for match in matches[1:]] + [len(deck)]
+    return [(match.group(1), deck[match.end():end]) for match, end in zip(matches, ends)]
+
+def decay_table(bounds, irrad_t, powers, decay_t):
+    t_end = irrad_t[-1]
+    times = [0.0] + decay_t
+    table = list()
+    for band_no, (Emax, Emin) in enumerate(zip(bounds[:-1], bounds[1:])):
+        decay_const = math.log(2) / (10.0 * (band_no + 1))
+        intensities = list()
+        for t in times:
+            intensity = 0.0
+            t_prev = 0.0
+            for t_irrad, power in zip(irrad_t, powers):
+                intensity += (1e16 * power * (t_irrad - t_prev) * (Emax - Emin) / Emax *
+                              math.exp(-decay_const * (t_end - t_irrad + t)))
+                t_prev = t_irrad
+            intensities.append(intensity)
+        table.append((Emax, Emin, intensities))
+    return [t_end + t for t in times], table
+
+def write_out(deck_fn):
+    with open(file = deck_fn, mode = 'r', encoding = 'cp1251') as deck_file_object:
+        deck = deck_file_object.read()
+    bounds = sorted(read_array(deck, "gamma")[0], reverse = True)   # eV
+    cases = read_cases(deck)
+
+    f71_fn = os.path.splitext(deck_fn)[0] + ".f71"
+    if os.path.isfile(f71_fn):
+        os.remove(f71_fn)
+    out_fn = os.path.splitext(deck_fn)[0] + ".out"
+    with open(file = out_fn, mode = 'w', encoding = 'cp1251') as out_file_object:
+        out_file_object.write(" ORIGEN stub output\n.\n")
+        for case_no, (case, case_text) in enumerate(cases):
+            case_powers = read_array(case_text, "power")
+            if len(case_powers) > 0:
+                # Irradiation case, the decay case goes after it
+                irrad_t = read_array(case_text, "t")[0]                     # hours
+                powers = case_powers[0]                                     # MW
+                continue
+            decay_t = read_array(case_text, "t")[0]                         # hours
+            times, table = decay_table(bounds, irrad_t, powers, decay_t)
+            title = SpectrumTitle.format(case, case_no + 1, len(cases))
+            out_file_object.write("=" * 121 + "\n")
+            out_file_object.write(f"=   {title:<115s} =\n")
+            out_file_object.write("-" * 121 + "\n")
+            out_file_object.write("     boundaries (MeV)  " +
+                                  "".join(f"{t:10.1f}hr " for t in times) + "\n")
+            for Emax, Emin, intensities in table:
+                out_file_object.write(f" {Emax/1e6:9.3E} - {Emin/1e6:9.3E}  " +
+                                      "".join(f"  {value:10.4E}" for value in intensities) + "\n")
+            out_file_object.write("  " + "-" * 20 + "\n")
+            out_file_object.write("=" * 121 + "\n")
+    with open(file = os.path.splitext(deck_fn)[0] + ".msg", mode = 'w',
+              encoding = 'utf8') as msg_file_object:
+        msg_file_object.write(f"ORIGEN stub job\nInput file named {deck_fn}\n"
+                              f"and output file named {out_fn}\n")
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: OrigenStub.py deck.inp ...", file = sys.stderr)
+        sys.exit(1)
+    for deck_fn in sys.argv[1:]:
+        write_out(deck_fn)
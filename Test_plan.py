@@ -1,9 +1,17 @@
 #!/usr/bin/env python3
 
+import CreateCacheDir
 import DataReader
 import FA_Gamma
+import FileScanner
+import FINReader
+import OrigenCache
+import OrigenExecutor
+import OrigenF71
 import m_print
-import datetime, re, os, math, subprocess, string
+import datetime, re, os, math, string, hashlib
+import numpy as np
+import concurrent.futures
 
 TIME_FORMAT = '%d.%m.%Y %H:%M:%S'
 
@@ -25,6 +33,27 @@ maxW_fn = "maxW_history.txt"
 maxW2_fn = "maxW2_history.txt"
 
 MCUDIRName = "MCU_FIN"
+# Read only the R3 and R18 tally blocks of the .FIN files using
+# the cached blocks index, otherwise scan the whole files line by line
+READ_FIN_BLOCKS = True
+# Keep the parsed TAlgorithm data in the binary cache, see TAlgorithm.read_cached()
+CACHE_ALGORITHMS = True
+ALGORITHM_CACHE_VERSION = 1
+# Number of processes parsing the .FIN files in ReadStaticData(),
+# 1 parses them one after another in this process
+FIN_PARSE_WORKERS = 1
+# Storage type of the dense Green functions tensor FA_Gamma.TGreenTensor,
+# np.float32 halves the memory
+GREEN_TENSOR_DTYPE = np.float64
+# Read the Green functions from the memory mapped binary cache,
+# see FA_Gamma.read_cached_greens()
+CACHE_GREENS = True
+# With CACHE_GREENS InitStaticArray() doesn't read the Green functions,
+# ProcessCell() takes only the cell reg zones slice of the memory mapped
+# cache on demand, see FA_Gamma.TGreenLibrary
+LAZY_GREENS = True
+# Reg zones of the FA cell dose rates, see TCoreHistory.FACellDoseRate()
+CellRegZones = range(130,150)
 ZoneKey = "MCU zone"
 CellKey = "Cell"
 ChannelKey = "Channel"
@@ -55,10 +84,31 @@ RefDetEffectivenessField = "Eff"
 # ORIGEN-related constants
 OrigenDIRName = "Origens"
 template_file_name = "Origen_template.inp"
-scale_bin = "c:\\SCALE-6.2.4\\bin\\scalerte.exe"
+# scalerte path, may be set by SCALE_BIN environment variable,
+# "OrigenStub.py" runs the flow without SCALE
+scale_bin = os.environ.get("SCALE_BIN", "c:\\SCALE-6.2.4\\bin\\scalerte.exe")
+# Number of ORIGEN processes run at once, see RunOrigens(). The histories
+# are spread over at least ORIGEN_WORKERS decks, so the packing by
+# ORIGEN_CASES_PER_DECK doesn't leave the workers idle
+ORIGEN_WORKERS = 1
+# Keep the parsed ORIGEN results by the deck hash and don't run
+# the same deck again, see OrigenCache.TOrigenCache
+CACHE_ORIGEN = True
+ORIGEN_CACHE_BYTES = 256 * 2**20
+# Read the decay case spectra from the binary .f71 file of the deck,
+# the .out table is parsed if there is no .f71 file, see OrigenF71
+READ_ORIGEN_F71 = True
+# Maximal number of the histories packed into one multi-case ORIGEN deck
+# as the irrad_<n> and decay_<n> cases, see MakeOrigenCasesFile(); 1 runs
+# every history by its own deck made by MakeOrigenFile(). Fewer histories
+# are packed if the decks are less than ORIGEN_WORKERS then, see
+# TCoreHistory.RunOrigenHistories()
+ORIGEN_CASES_PER_DECK = 10
 MARKER_T = "t=[ 1234567890987654321.1234567890987654321 ]"
 MARKER_PWR = "power = [ 1234567890987654321.1234567890987654321e38 ]"
 MARKER_TREG = "tt=[ 12 34 56 78 90 98 76 54 32 10 ]"
+IRRAD_CASE = "case (irrad)"
+DECAY_CASE = "case (decay)"
 TIME_SHIFT = 10000.0
 DECAY_HOURS = 320
 
@@ -85,45 +135,115 @@ def write_data_file(fn, *arrays):
                                     for data_field in data_fields)
             file_object.write(data_string + '\n')
 
-def MakeOrigenFile(Origen_fn, str_t, str_power, str_treg):
-    fn = os.path.join(os.curdir, OrigenDIRName, Origen_fn)
+def ReadOrigenTemplate():
     template_fn = os.path.join(os.curdir, OrigenDIRName, template_file_name)
     with open(file = template_fn,
              mode='r', encoding='cp1251') as template_file_object:
         entire_file = template_file_object.read()
     m_print.m_print(f"File {template_file_name} opened, it's length is {len(entire_file)}")
+    return entire_file
 
-    t_position = entire_file.find(MARKER_T)
-    pwr_position = entire_file.find(MARKER_PWR)
-    treg_position = entire_file.find(MARKER_TREG)
-    m_print.m_print(f"t_position is {t_position}, pwr_position is {pwr_position}")
-
+def FillOrigenTemplate(entire_file, str_t, str_power, str_treg):
     t_corrected = entire_file.replace(MARKER_T, str_t)
     pwr_corrected = t_corrected.replace(MARKER_PWR, str_power)
-    treg_corrected = pwr_corrected.replace(MARKER_TREG, str_treg)
+    return pwr_corrected.replace(MARKER_TREG, str_treg)
 
+def WriteOrigenFile(Origen_fn, deck):
+    fn = os.path.join(os.curdir, OrigenDIRName, Origen_fn)
     with open(file = fn, mode='w', encoding='cp1251') as origen_file_object:
-        origen_file_object.write(treg_corrected)
+        origen_file_object.write(deck)
     m_print.m_print(f"File {fn} saved")
 
+def MakeOrigenFile(Origen_fn, str_t, str_power, str_treg):
+    entire_file = ReadOrigenTemplate()
+
+    t_position = entire_file.find(MARKER_T)
+    pwr_position = entire_file.find(MARKER_PWR)
+    treg_position = entire_file.find(MARKER_TREG)
+    m_print.m_print(f"t_position is {t_position}, pwr_position is {pwr_position}")
+
+    treg_corrected = FillOrigenTemplate(entire_file, str_t, str_power, str_treg)
+    WriteOrigenFile(Origen_fn, treg_corrected)
+    return treg_corrected
+
+def OrigenDecayCases(cases):
+    ''' Names of the decay cases of the deck of the cases histories
+    '''
+    if cases == 1:
+        return ["decay"]
+    return [f"decay_{case_no}" for case_no in range(cases)]
+
+def MakeOrigenCasesFile(Origen_fn, histories, str_treg):
+    ''' Deck of the template cases repeated for every (str_t, str_power)
+        of histories, they are named irrad_<n> and decay_<n>. Every
+        irradiation case starts from its own material at time 0, the
+        decay case goes after it as in the template.
+    '''
+    entire_file = ReadOrigenTemplate()
+    cases_position = entire_file.find(IRRAD_CASE)
+    end_position = entire_file.rfind("\nend")
+    if cases_position == -1 or end_position < cases_position:
+        raise CoreProcException(f"No {IRRAD_CASE} in {template_file_name}")
+    cases_template = entire_file[cases_position:end_position]
+
+    deck_parts = [entire_file[:cases_position]]
+    for case_no, (str_t, str_power) in enumerate(histories):
+        if case_no > 0:
+            str_t = "start=0\n             " + str_t
+        case = FillOrigenTemplate(cases_template, str_t, str_power, str_treg)
+        case = case.replace(IRRAD_CASE, f"case (irrad_{case_no})")
+        case = case.replace(DECAY_CASE, f"case (decay_{case_no})")
+        deck_parts.append(case)
+    deck_parts.append(entire_file[end_position:])
+    deck = "".join(deck_parts)
+    WriteOrigenFile(Origen_fn, deck)
+    return deck
+
 def RunOrigen(task_fn):
-    origen_fn = os.path.join(os.curdir, OrigenDIRName, task_fn)
-    call_args = [scale_bin, origen_fn]
-    try:
-        result = subprocess.run(call_args, check=True,
-                                stdout=subprocess.PIPE,
-                                stderr=subprocess.PIPE,
-                                encoding='utf-8')
-        if result.returncode == 0:
-            m_print.m_print("Origen was run successfully")
-        else:
-            m_print.m_print(f"Origen's exit code was {result.returncode}")
-    except subprocess.CalledProcessError as ex:
-        m_print.m_print("Exception while Origen-ing")
-        m_print.m_print("Exit status = {}".format(ex.returncode))
-        m_print.m_print("Invokation string was {}".format(ex.cmd))
-        m_print.m_print("scalerte stdout was {}".format(ex.stdout))
-        m_print.m_print("scalerte stderr was {}".format(ex.stderr))
+    RunOrigens([task_fn])
+
+def RunOrigens(task_fns, on_done = None):
+    ''' Runs the ORIGEN decks of Origens directory by ORIGEN_WORKERS
+        processes at once, on_done(job) is called as soon as every job
+        is finished successfully, see OrigenExecutor.TOrigenExecutor.run().
+        CoreProcException is raised after all runs if some of them failed
+    '''
+    def on_job_done(job):
+        # The outputs of the failed run are not read
+        if job.ok and on_done is not None:
+            on_done(job)
+
+    executor = OrigenExecutor.TOrigenExecutor(scale_bin, ORIGEN_WORKERS)
+    jobs = executor.run([os.path.join(os.curdir, OrigenDIRName, task_fn)
+                         for task_fn in task_fns], on_job_done)
+    failed = [job.deck_fn for job in jobs if not job.ok]
+    if len(failed) > 0:
+        raise CoreProcException(f"Origen failed for {', '.join(failed)}")
+    return jobs
+
+def RemoveOrigenOutputs(task_fn):
+    ''' Removes .out and .f71 files of the previous run of the deck,
+        so a failed run never leaves them to be read as its results
+    '''
+    for ext in (".out", ".f71"):
+        fn = os.path.join(os.curdir, OrigenDIRName, task_fn + ext)
+        if os.path.isfile(fn):
+            os.remove(fn)
+
+# ORIGEN results cache of scale_bin, see GetOrigenCache()
+Origen_cache = None
+
+def GetOrigenCache():
+    ''' OrigenCache.TOrigenCache of the current scale_bin or None
+        if CACHE_ORIGEN is off
+    '''
+    global Origen_cache
+    if not CACHE_ORIGEN:
+        return None
+    if (Origen_cache is None or
+        Origen_cache.scale_id != OrigenCache.scale_identity(scale_bin)):
+        Origen_cache = OrigenCache.TOrigenCache(scale_bin, ORIGEN_CACHE_BYTES)
+    return Origen_cache
 
 def ReadLine(line):
     line_pattern = re.compile(
@@ -195,6 +315,18 @@ def ReadR3Line(MCU_detectors_reader, line):
 
     return data_line_OK, detector
 
+def MapZones(reader, zones, *fields):
+    ''' Vectorized counterpart of reader[zone] for the array of zones:
+        returns the mask of the zones found in the reader and
+        the columns of the fields values of their records
+    '''
+    rec_nos = reader.get_dense_index(DataReader.RegZoneField)
+    zones = zones.astype(np.int64)
+    found = (zones >= 0) & (zones < len(rec_nos))
+    found[found] = rec_nos[zones[found]] >= 0
+    found_rec_nos = rec_nos[zones[found]]
+    return found, [reader.get_column(field)[found_rec_nos] for field in fields]
+
 # Calculated FAs - there ara whole core of them in each TAlgorithm
 class TCalcFA(object):
     def __init__(self):
@@ -212,6 +344,9 @@ class TAlgorithm(object):
     hdr_line = "         Zone          Mean        StdDev"
     R3_line  = " NUCLIDE:          MIXT, REACTION:            3, ENERGY:    0.00000E+00"
     R18_line = " NUCLIDE:          MIXT, REACTION:           18, ENERGY:    0.00000E+00"
+    # The same tables for FINReader.read_tallies()
+    R3_tally = dict(section = "ZONES", nuclide = "MIXT", reaction = 3, energy = 0.0)
+    R18_tally = dict(section = "ZONES", nuclide = "MIXT", reaction = 18, energy = 0.0)
 
     def __init__(self, FAs_reader, detectors_eff_reader, MCU_detectors_reader,
                  HCrit, NFAs, FINfn, isRefAlg):
@@ -221,81 +356,103 @@ class TAlgorithm(object):
         self.Hcrit = float(HCrit)
         self.isReference = bool(isRefAlg)
 
-        def add_detector(data_dict):
+        def add_detector(channel, R3):
             detector = Tdetector()
-            detector.channel = data_dict[ChannelKey]
-            detector.R3 = data_dict[MeanKey]
-            self.detectors[data_dict[ChannelKey]] = detector
+            detector.channel = channel
+            detector.R3 = R3
+            self.detectors[channel] = detector
 
-        def add_mod_FA(data_dict):
+        def add_mod_FA(cell, pitch, fissions):
             global MCU_FA_spans
-            if data_dict[CellKey] not in self.FAs:
-                self.FAs[data_dict[CellKey]] = TCalcFA()
-            self.FAs[data_dict[CellKey]].fissions[data_dict[PitchKey]
-                                                ] = data_dict[MeanKey]
-            if data_dict[PitchKey] + 1 > MCU_FA_spans:
-                MCU_FA_spans = data_dict[PitchKey] + 1
+            if cell not in self.FAs:
+                self.FAs[cell] = TCalcFA()
+            self.FAs[cell].fissions[pitch] = fissions
+            if pitch + 1 > MCU_FA_spans:
+                MCU_FA_spans = pitch + 1
 
         # Read MCU .fin file
         fn = os.path.join(MCUDIRName, FINfn)
-        R3Lines2find = 3
-        R18Lines2find = 3
-        R3Records = 0; R18Records = 0
-        R3Over = False; R18Over = False
-        with open(file = fn, mode='r', encoding='utf8') as FINfileObject:
-            finLineNo = 0
-            for finLine in FINfileObject:
-                finLineNo += 1
-                if finLine.startswith(type(self).zones_line):
-                    # print("ZONES found")
-                    R3Lines2find -= 1
-                    R18Lines2find -= 1
-                    continue
-                if finLine.startswith(type(self).objects_line):
-                    # print("OBJECTS found")
-                    R3Lines2find += 10
-                    R18Lines2find += 10
-                    continue
-                if finLine.startswith(type(self).R3_line):
-                    # print("MIX R3 found")
-                    R3Lines2find -= 1
-                    continue
-                if finLine.startswith(type(self).R18_line):
-                    # print("MIX R18 found")
-                    R18Lines2find -= 1
-                    continue
-                if R3Lines2find == 1 and finLine.startswith(type(self).hdr_line):
-                    R3Lines2find -= 1
-                    continue
-                if R3Lines2find == 0:
-                    # Read MIX R3 info
-                    # print(f"Reading R3, line no = {finLineNo}")
-                    data_line_OK, data_dict = ReadR3Line(MCU_detectors_reader, finLine)
-                    if not data_line_OK:
-                        # Finished reading R3 array
+        if READ_FIN_BLOCKS:
+            # Zone Mean StdDev tables are decoded at once,
+            # the zones unknown to the readers are skipped
+            selection = {"R3": type(self).R3_tally, "R18": type(self).R18_tally}
+            tallies = FINReader.read_tallies(fn, selection)
+            for name, criteria in selection.items():
+                if len(tallies[name]) == 0:
+                    raise FINReader.FINBlockNotFound(fn, criteria)
+            R3_tally = tallies["R3"][0]
+            found, (channels,) = MapZones(MCU_detectors_reader, R3_tally.keys,
+                                          R3ChannelField)
+            for channel, R3 in zip(channels.astype(np.int64).tolist(),
+                                   R3_tally.means[found].tolist()):
+                add_detector(channel, R3)
+            R18_tally = tallies["R18"][0]
+            found, (cells, pitches) = MapZones(FAs_reader, R18_tally.keys,
+                                               R18CellField, R18PitchField)
+            for cell, pitch, fissions in zip(cells.tolist(),
+                                             pitches.astype(np.int64).tolist(),
+                                             R18_tally.means[found].tolist()):
+                add_mod_FA(cell, pitch, fissions)
+        else:
+            R3Lines2find = 3
+            R18Lines2find = 3
+            R3Records = 0; R18Records = 0
+            R3Over = False; R18Over = False
+            with open(file = fn, mode='r', encoding='utf8') as FINfileObject:
+                finLineNo = 0
+                for finLine in FINfileObject:
+                    finLineNo += 1
+                    if finLine.startswith(type(self).zones_line):
+                        # print("ZONES found")
+                        R3Lines2find -= 1
+                        R18Lines2find -= 1
+                        continue
+                    if finLine.startswith(type(self).objects_line):
+                        # print("OBJECTS found")
                         R3Lines2find += 10
-                        R3Over = True
-                    elif data_dict[RecUsefullKey]:
-                        # print_dict(data_dict)
-                        add_detector(data_dict)
-                        R3Records += 1
-                if R18Lines2find == 1 and finLine.startswith(type(self).hdr_line):
-                    R18Lines2find -= 1
-                    continue
-                if R18Lines2find == 0:
-                    # Read MIX R18 info
-                    # print(f"Reading R18, line no = {finLineNo}")
-                    data_line_OK, data_dict = ReadR18Line(FAs_reader, finLine)
-                    if not data_line_OK:
-                        # Finished reading R18 array
                         R18Lines2find += 10
-                        R18Over = True
-                    elif data_dict[RecUsefullKey]:
-                        # print_dict(data_dict)
-                        add_mod_FA(data_dict)
-                        R18Records += 1
-                if R3Over and R18Over:
-                    break
+                        continue
+                    if finLine.startswith(type(self).R3_line):
+                        # print("MIX R3 found")
+                        R3Lines2find -= 1
+                        continue
+                    if finLine.startswith(type(self).R18_line):
+                        # print("MIX R18 found")
+                        R18Lines2find -= 1
+                        continue
+                    if R3Lines2find == 1 and finLine.startswith(type(self).hdr_line):
+                        R3Lines2find -= 1
+                        continue
+                    if R3Lines2find == 0:
+                        # Read MIX R3 info
+                        # print(f"Reading R3, line no = {finLineNo}")
+                        data_line_OK, data_dict = ReadR3Line(MCU_detectors_reader, finLine)
+                        if not data_line_OK:
+                            # Finished reading R3 array
+                            R3Lines2find += 10
+                            R3Over = True
+                        elif data_dict[RecUsefullKey]:
+                            # print_dict(data_dict)
+                            add_detector(data_dict[ChannelKey], data_dict[MeanKey])
+                            R3Records += 1
+                    if R18Lines2find == 1 and finLine.startswith(type(self).hdr_line):
+                        R18Lines2find -= 1
+                        continue
+                    if R18Lines2find == 0:
+                        # Read MIX R18 info
+                        # print(f"Reading R18, line no = {finLineNo}")
+                        data_line_OK, data_dict = ReadR18Line(FAs_reader, finLine)
+                        if not data_line_OK:
+                            # Finished reading R18 array
+                            R18Lines2find += 10
+                            R18Over = True
+                        elif data_dict[RecUsefullKey]:
+                            # print_dict(data_dict)
+                            add_mod_FA(data_dict[CellKey], data_dict[PitchKey],
+                                       data_dict[MeanKey])
+                            R18Records += 1
+                    if R3Over and R18Over:
+                        break
 
         # Calculate total core fissions
         self.total_fissions = float(0)
@@ -308,6 +465,175 @@ class TAlgorithm(object):
             for span in FA.fissions:
                 FA.fissions[span] /= self.total_fissions
 
+    def save_cache(self, cache_fn, meta):
+        ''' Saves the parsed fission distribution and detectors R3 values,
+            Hcrit and the reference flag come from FINsListFile every time
+        '''
+        cells = list(self.FAs)
+        cell_codes = list(); spans = list(); fissions = list()
+        for cell_code, FA in enumerate(self.FAs.values()):
+            for span, span_fissions in FA.fissions.items():
+                cell_codes.append(cell_code)
+                spans.append(span)
+                fissions.append(span_fissions)
+        arrays = {"cells": np.array(cell_codes, dtype = np.int32),
+                  "spans": np.array(spans, dtype = np.int32),
+                  "fissions": np.array(fissions, dtype = np.float64),
+                  "channels": np.array(list(self.detectors), dtype = np.int64),
+                  "R3": np.array([det.R3 for det in self.detectors.values()],
+                                 dtype = np.float64)}
+        meta = dict(meta, cells = cells, total_fissions = self.total_fissions)
+        DataReader.save_arrays(cache_fn, meta, arrays)
+
+    @classmethod
+    def from_cache(cls, arrays, meta, HCrit, isRefAlg):
+        global MCU_FA_spans
+        alg = cls.__new__(cls)
+        alg.FAs = dict()
+        alg.detectors = dict()
+        alg.Hcrit = float(HCrit)
+        alg.isReference = bool(isRefAlg)
+        alg.total_fissions = meta["total_fissions"]
+
+        cells = meta["cells"]
+        for cell_code, span, span_fissions in zip(arrays["cells"].tolist(),
+                                                  arrays["spans"].tolist(),
+                                                  arrays["fissions"].tolist()):
+            cell = cells[cell_code]
+            if cell not in alg.FAs:
+                alg.FAs[cell] = TCalcFA()
+            alg.FAs[cell].fissions[span] = span_fissions
+            if span + 1 > MCU_FA_spans:
+                MCU_FA_spans = span + 1
+        for channel, R3 in zip(arrays["channels"].tolist(), arrays["R3"].tolist()):
+            detector = Tdetector()
+            detector.channel = channel
+            detector.R3 = R3
+            alg.detectors[channel] = detector
+        return alg
+
+    @classmethod
+    def read_cached(cls, FAs_reader, detectors_eff_reader, MCU_detectors_reader,
+                    HCrit, NFAs, FINfn, isRefAlg, config_hash,
+                    cache_dir = CreateCacheDir.CacheDir):
+        ''' TAlgorithm restored from the binary cache if the .FIN file
+            and the MCU zones configuration (config_hash, see
+            MCU_config_hash()) are the same as they were when it was parsed
+        '''
+        fn = os.path.join(MCUDIRName, FINfn)
+        cache_fn = DataReader.cache_file_name(fn, "TAlgorithm", cache_dir)
+        stat = os.stat(fn)
+        FIN_hash = None
+        try:
+            meta, arrays = DataReader.load_arrays(cache_fn)
+            if (meta["version"] == ALGORITHM_CACHE_VERSION and
+                meta["config_hash"] == config_hash and
+                meta["size"] == stat.st_size):
+                valid = (meta["mtime"] == stat.st_mtime_ns)
+                if not valid:
+                    FIN_hash = DataReader.file_hash(fn)
+                    valid = (meta["hash"] == FIN_hash)
+                if valid:
+                    alg = cls.from_cache(arrays, meta, HCrit, isRefAlg)
+                    if meta["mtime"] != stat.st_mtime_ns:
+                        alg.save_cache(cache_fn, dict(meta, mtime = stat.st_mtime_ns))
+                    return alg
+        except (OSError, KeyError, IndexError, TypeError, ValueError):
+            # No cache entry yet or it is unreadable
+            pass
+
+        if FIN_hash is None:
+            FIN_hash = DataReader.file_hash(fn)
+        alg = cls(FAs_reader, detectors_eff_reader, MCU_detectors_reader,
+                  HCrit, NFAs, FINfn, isRefAlg)
+        alg.save_cache(cache_fn, {"version": ALGORITHM_CACHE_VERSION,
+                                  "config_hash": config_hash,
+                                  "size": stat.st_size,
+                                  "mtime": stat.st_mtime_ns,
+                                  "hash": FIN_hash})
+        return alg
+
+def MCU_config_hash():
+    ''' Hash of the MCU zones configuration files used by TAlgorithm
+    '''
+    hashes = [DataReader.file_hash(os.path.join(os.curdir, ConfigDIRName, fn))
+              for fn in (MCU_FAs_fn, MCU_detectors_fn)]
+    return hashlib.sha256(" ".join(hashes).encode("utf8")).hexdigest()
+
+def make_algorithm(readers, HCrit, NFAs, FINfn, isRefAlg, config_hash):
+    ''' TAlgorithm parsed or read from the cache if config_hash is given
+    '''
+    if config_hash is None:
+        return TAlgorithm(*readers, HCrit, NFAs, FINfn, isRefAlg)
+    return TAlgorithm.read_cached(*readers, HCrit, NFAs, FINfn, isRefAlg,
+                                  config_hash)
+
+# Config readers of the .FIN parsing worker process, see init_FIN_worker()
+FIN_worker_readers = None
+
+def init_FIN_worker(readers, read_FIN_blocks):
+    global FIN_worker_readers, READ_FIN_BLOCKS
+    FIN_worker_readers = readers
+    READ_FIN_BLOCKS = read_FIN_blocks
+
+def parse_FIN(alg_args):
+    return make_algorithm(FIN_worker_readers, *alg_args)
+
+
+# Dense fission fractions of all the algorithms:
+# K[alg_no, cell_no, span] is Algorithms[alg_keys[alg_no]
+#                               ].FAs[cells[cell_no]].fissions[span]
+# alg_nos and cell_nos are the reverse maps of alg_keys and cells,
+# the spans missing in the algorithm have zero K and False defined.
+class TFissionTensor(object):
+    # The tensor of the last algorithms dictionary, see of()
+    last = None
+
+    def __init__(self, algorithms):
+        self.algorithms = algorithms
+        self.alg_objects = list(algorithms.values())
+        self.alg_keys = list(algorithms)
+        self.alg_nos = {alg_key: n for n, alg_key in enumerate(self.alg_keys)}
+        self.NFAs = np.array([alg_key[1] for alg_key in self.alg_keys],
+                             dtype = np.int64)
+        self.cells = list()
+        self.cell_nos = dict()
+        self.spans = 0
+        for alg in self.alg_objects:
+            for cell, FA in alg.FAs.items():
+                if cell not in self.cell_nos:
+                    self.cell_nos[cell] = len(self.cells)
+                    self.cells.append(cell)
+                if len(FA.fissions) > 0:
+                    self.spans = max(self.spans, max(FA.fissions) + 1)
+
+        self.K = np.zeros((len(self.alg_keys), len(self.cells), self.spans),
+                          dtype = np.float64)
+        self.defined = np.zeros(self.K.shape, dtype = bool)
+        for alg_no, alg in enumerate(self.alg_objects):
+            for cell, FA in alg.FAs.items():
+                cell_no = self.cell_nos[cell]
+                spans = list(FA.fissions)
+                self.K[alg_no, cell_no, spans] = list(FA.fissions.values())
+                self.defined[alg_no, cell_no, spans] = True
+
+    @classmethod
+    def of(cls, algorithms):
+        ''' The tensor is built once for the algorithms dictionary
+            and rebuilt only if other algorithms are passed
+        '''
+        tensor = cls.last
+        if (tensor is None or tensor.algorithms is not algorithms or
+            len(tensor.alg_objects) != len(algorithms) or
+            any(alg is not tensor_alg for alg, tensor_alg
+                in zip(algorithms.values(), tensor.alg_objects))):
+            tensor = cls(algorithms)
+            cls.last = tensor
+        return tensor
+
+    def alg_no(self, alg_name, NFAs):
+        return self.alg_nos[(alg_name, NFAs)]
+
 
 # Actual FAs
 class TFA(object):
@@ -471,7 +797,11 @@ class TEnvelopeFAspanHistory(object):
 
 class TCoreHistory(object):
     history_fn = "Test_Plan.txt"
+    history_schema = "t: float, N(W): float, Algorithm: str, FAs: int"
     Origen_fns = ["max_burnup", "max_2_hours", "envelope"]
+    # History reader is shared by all TCoreHistory instances,
+    # see read_history()
+    history_reader = None
     # NRB-99 constants for photon fluxes per 1e-12 Sv
     NRB = {10e3:0.0485, 15e3:0.125, 20e3:0.205, 30e3:0.300,  40e3:0.338,
            50e3:0.357,  60e3:0.378, 80e3:0.440, 0.1e6:0.517, 0.15e6:0.752,
@@ -488,6 +818,19 @@ class TCoreHistory(object):
             data_file_object.write(line)
 
 
+    # Only the history records appended since the previous
+    # TCoreHistory creation are parsed, the file being rewritten
+    # is reread completely
+    @classmethod
+    def read_history(cls, fn):
+        reader = cls.history_reader
+        if reader is None or reader.data_file_name != fn:
+            reader = DataReader.TDataReader(fn, schema = cls.history_schema)
+            cls.history_reader = reader
+        else:
+            reader.refresh()
+        return reader
+
     def __init__(self, _algorithms, _Greens):
         TimeField = "t"
         PowerField = "N(W)"
@@ -504,7 +847,7 @@ class TCoreHistory(object):
 
         # Read the core test planned schedule
         fn = os.path.join(os.curdir, ConfigDIRName, type(self).history_fn)
-        self.HistoryReader = DataReader.TDataReader(fn)
+        self.HistoryReader = type(self).read_history(fn)
         m_print.m_print("Core test plan read successfully")
         m_print.m_print("Fields: ")
         m_print.m_print(self.HistoryReader.fields)
@@ -546,6 +889,18 @@ class TCoreHistory(object):
         # Dictionary of MCU_FA_spans elements
         self.Wenvelope_axial = dict()
 
+        # Fission fractions of the reference algorithm cells in self.FAs
+        # order for every algorithm, K_cells[alg_no, cell_no, FAspan]
+        self.fission_tensor = TFissionTensor.of(self.algorithms)
+        FA_cells = list(self.FAs)
+        K_cells = self.fission_tensor.K[:, [self.fission_tensor.cell_nos[cell]
+                                            for cell in FA_cells], :]
+        FA_spans = range(self.fission_tensor.spans)
+        burnups = np.zeros(K_cells.shape[1:])
+        burnups2 = np.zeros(K_cells.shape[1:])
+        FA_burnups = np.zeros(len(FA_cells))
+        FA_burnups2 = np.zeros(len(FA_cells))
+
         # Prev 2 hours
         last_history_time = self.HistoryReader.raw_data[-1][self.TimeIndex]
         last2hours = last_history_time - 2
@@ -561,35 +916,38 @@ class TCoreHistory(object):
             dt = time - prev_history_time
             burnup = pwr * dt              # W*hr
             prev_history_time = time
-            max_burnup = 0.0
-            max_cell = ""
-            max_span = -1
-            max_K = 0.0
-            for FA in self.FAs:
-                for FAspan in self.FAs[FA].burnup:
-                    K = self.algorithms[(alg_name, alg_FAs)
-                                        ].FAs[FA].fissions[FAspan]
-                    # Accumulate the total burnup
-                    span_burnup = burnup * K
-                    self.FAs[FA].burnup[FAspan] += span_burnup
-                    # Find the maximum for envelope
-                    if span_burnup > max_burnup:
-                        max_burnup = span_burnup
-                        max_cell = FA
-                        max_span = FAspan
-                        max_K = K
-                    self.FAs[FA].FA_burnup += span_burnup   # W*hr
+            K = K_cells[self.fission_tensor.alg_no(alg_name, alg_FAs)]
+            # Accumulate the total burnup, FA burnups are summed
+            # span by span as the spans burnups were added
+            span_burnups = burnup * K
+            burnups += span_burnups
+            for FAspan in FA_spans:
+                FA_burnups += span_burnups[:, FAspan]   # W*hr
+            # Find the maximum for envelope
+            max_no = int(np.argmax(span_burnups))
+            if span_burnups.flat[max_no] > 0.0:
+                max_cell_no, max_span = divmod(max_no, len(FA_spans))
+                max_cell = FA_cells[max_cell_no]
+                max_K = float(K.flat[max_no])
+            else:
+                max_cell = ""
+                max_span = -1
+                max_K = 0.0
             self.Wenvelope_history.add_point(
                               time, pwr*max_K, max_cell, max_span)
 
-            for FA in self.FAs2:
-                for FAspan in self.FAs2[FA].burnup:
-                    K = self.algorithms[(alg_name, alg_FAs)
-                                        ].FAs[FA].fissions[FAspan]
-                    # Accumulate the burnup for last 2 hours
-                    if time > last2hours:
-                        self.FAs2[FA].burnup[FAspan] += burnup * K
-                        self.FAs2[FA].FA_burnup += burnup * K      # W*hr
+            # Accumulate the burnup for last 2 hours
+            if time > last2hours:
+                burnups2 += span_burnups
+                for FAspan in FA_spans:
+                    FA_burnups2 += span_burnups[:, FAspan]   # W*hr
+
+        for cell_no, cell in enumerate(FA_cells):
+            for FAspan in self.FAs[cell].burnup:
+                self.FAs[cell].burnup[FAspan] = float(burnups[cell_no, FAspan])
+                self.FAs2[cell].burnup[FAspan] = float(burnups2[cell_no, FAspan])
+            self.FAs[cell].FA_burnup = float(FA_burnups[cell_no])
+            self.FAs2[cell].FA_burnup = float(FA_burnups2[cell_no])
 
         # Now let's find the FA span with the maximum total burnup
         max_cell = ""
@@ -605,15 +963,11 @@ class TCoreHistory(object):
         m_print.m_print(f"cell {max_cell} span {max_span} burnup {max_burnup} W*hr")
 
         # And FA span burnup envelope
-        self.Wenvelope_axial = {k:0.0 for k in range(MCU_FA_spans)}
-        for FA in self.FAs:
-            for alg in self.algorithms:
-                for FAspan in range(MCU_FA_spans):
-                    # alg is (alg_name, NFAs) tuple - key to self.algorithms dictionary
-                    span_fissions = self.algorithms[alg].FAs[FA].fissions[FAspan
-                                                 ] * MCU_FA_spans * alg[1]
-                    if span_fissions > self.Wenvelope_axial[FAspan]:
-                        self.Wenvelope_axial[FAspan] = span_fissions
+        # Relative fissions of every algorithm normalized by NFAs
+        span_fissions = (K_cells[:, :, :MCU_FA_spans] * MCU_FA_spans *
+                         self.fission_tensor.NFAs[:, np.newaxis, np.newaxis])
+        self.Wenvelope_axial = {FAspan: max(0.0, float(span_fissions[:, :, FAspan].max()))
+                                for FAspan in range(MCU_FA_spans)}
 
         m_print.m_print("Axial relative burnup envelope:")
         m_print.m_print(self.Wenvelope_axial)
@@ -665,6 +1019,12 @@ class TCoreHistory(object):
         m_print.m_print(f"FA with max burnup for last 2 hours is {max_cell}: {max_burnup} W*hrs")
 
     def ParseOrigenOut(self, Origen_fn, container):
+        self.ParseOrigenCasesOut(Origen_fn, [("decay", container)])
+
+    def ParseOrigenCasesOut(self, Origen_fn, cases):
+        ''' Parses the spectra of the cases [(case name, container)]
+            of the .out file, they are in the output in the cases order
+        '''
         def ParseOrigenLine(line):
             clear_line = line.strip(string.whitespace)
             separators = re.compile(
@@ -676,45 +1036,66 @@ class TCoreHistory(object):
                 vals = None
             return vals
 
-        def StoreOrigenEnergyBand(values):
+        def StoreOrigenEnergyBand(values, container):
             Emin = 1e6 * min(values[0:2])  # eV
             Emax = 1e6 * max(values[0:2])  # eV
             container[(Emin, Emax)] = values[2:]
 
 
-        spectrum_line = "Gamma source intensity (1/s) as a function of time for case 'decay'"
         hdr_line = "boundaries (MeV)"
-        Lines2Find = 3
-        srcRecords = 0
         fn = os.path.join(os.curdir, OrigenDIRName, Origen_fn)
-        with open(file = fn, mode='r', encoding='cp1251') as OrigenfileObject:
-            OrigenLineNo = 0
-            for OrigenLine in OrigenfileObject:
-                OrigenLineNo += 1
-                if OrigenLine.find(spectrum_line) != -1:
-                    Lines2Find -= 1
-                    continue
-                if (Lines2Find == 2 and
-                    all(x=='-' for x in OrigenLine.strip(string.whitespace))):
-                    Lines2Find -= 1
-                    continue
-                if (Lines2Find == 1 and
-                    OrigenLine.find(hdr_line) != -1):
-                    Lines2Find -= 1
-                    continue
-                if Lines2Find == 0:
-                    # Read Origen spectrum part
-                    # m_print.m_print(f"Reading sources, line no = {OrigenLineNo}")
-                    values = ParseOrigenLine(OrigenLine)
-                    if values is None:
-                        # Finished reading sources
-                        break
-                    else:
-                        # m_print.m_print(values)
-                        StoreOrigenEnergyBand(values)
-                        srcRecords += 1
-
-        m_print.m_print(f"{srcRecords} Origen sources were read")
+        # Only the spectrum tables are decoded, the rest of ~1 MB output
+        # is searched for the markers as bytes
+        with FileScanner.TFileScanner(fn, encoding = 'cp1251') as scanner:
+            start = 0
+            for case, container in cases:
+                spectrum_line = f"Gamma source intensity (1/s) as a function of time for case '{case}'"
+                srcRecords = 0
+                pos = scanner.find(spectrum_line.encode('cp1251'), start)
+                if pos != -1:
+                    pos = scanner.find(hdr_line.encode('cp1251'), scanner.next_line(pos))
+                if pos != -1:
+                    start = scanner.next_line(pos)
+                    for OrigenLine in scanner.iter_lines(start):
+                        # Read Origen spectrum part
+                        values = ParseOrigenLine(OrigenLine)
+                        if values is None:
+                            # Finished reading sources
+                            break
+                        else:
+                            # m_print.m_print(values)
+                            StoreOrigenEnergyBand(values, container)
+                            srcRecords += 1
+
+                m_print.m_print(f"{srcRecords} Origen sources were read")
+
+    def ReadOrigenF71(self, Origen_fn, cases):
+        ''' Reads the decay cases spectra of the .f71 file into the containers
+            of cases [(case name, container)]. The cases are in the deck order,
+            every decay case goes after its irradiation case. False if there
+            is no such file or it can't be read
+        '''
+        fn = os.path.join(os.curdir, OrigenDIRName, Origen_fn)
+        if not os.path.isfile(fn):
+            return False
+        try:
+            if len(cases) == 1:
+                spectra = [OrigenF71.read_gamma_spectra(fn)]
+            else:
+                spectra = OrigenF71.read_cases_spectra(
+                    fn, [2 * (case_no + 1) for case_no in range(len(cases))]).values()
+        except OrigenF71.OrigenF71Exception as ex:
+            m_print.m_print(f"{ex}, the .out file is parsed")
+            return False
+        for (case, container), case_spectra in zip(cases, spectra):
+            container.update(case_spectra)
+            m_print.m_print(f"{len(case_spectra)} Origen sources were read from {Origen_fn}")
+        return True
+
+    def ReadOrigenResults(self, name, cases):
+        if READ_ORIGEN_F71 and self.ReadOrigenF71(name + ".f71", cases):
+            return
+        self.ParseOrigenCasesOut(name + ".out", cases)
 
     def InvokeOrigen(self, max_reg_hours):
         N_pts = 10
@@ -731,18 +1112,91 @@ class TCoreHistory(object):
         containers = [self.Wmax_src_spectrums,
                       self.Wmax2_src_spectrums,
                       self.Wenvelope_src_spectrums]
-        # Calls ORIGEN 3 times
+        # ORIGEN runs of 3 histories
         methods = [self.Wmax_history.build_origen_params,
                    self.Wmax2_history.build_origen_params,
                    self.Wenvelope_history.build_origen_params]
+        histories = dict()
         for fn, method, container in zip(
                     type(self).Origen_fns, methods, containers):
             str_t, str_power = method()
-            MakeOrigenFile(fn + ".inp", str_t, str_power, str_treg)
-            RunOrigen(fn + ".inp")
-            self.ParseOrigenOut(fn + ".out", container)
+            histories[fn] = (str_t, str_power, container)
+        self.RunOrigenHistories(histories, str_treg)
+
+    def RunOrigenHistories(self, histories, str_treg):
+        ''' histories is {name: (str_t, str_power, container)}. The spectra
+            found in the ORIGEN cache are taken from it, the other histories
+            are packed by ORIGEN_CASES_PER_DECK into the decks, but into
+            no less than ORIGEN_WORKERS decks if there are enough of them.
+            The decks are run and their outputs are read into the containers
+            as the runs are finished. The cache key is the one history deck
+            anyway.
+        '''
+        cache = GetOrigenCache()
+        keys = dict()
+        pending = list()
+        if cache is not None:
+            template = ReadOrigenTemplate()
+        for name, (str_t, str_power, container) in histories.items():
+            if cache is not None:
+                keys[name] = cache.key(FillOrigenTemplate(template, str_t, str_power, str_treg))
+                spectra = cache.get(keys[name])
+                if spectra is not None:
+                    m_print.m_print(f"Origen results of {name} are taken from the cache")
+                    container.update(spectra)
+                    continue
+            pending.append(name)
+
+        deck_histories = dict()
+        # Every worker gets a deck
+        per_deck = min(max(1, ORIGEN_CASES_PER_DECK),
+                       math.ceil(len(pending) / max(1, ORIGEN_WORKERS)))
+        for first in range(0, len(pending), per_deck):
+            names = pending[first:first+per_deck]
+            if len(names) == 1:
+                fn = names[0]
+                MakeOrigenFile(fn + ".inp", *histories[fn][:2], str_treg)
+            else:
+                fn = f"{names[0]}_{len(names)}cases"
+                MakeOrigenCasesFile(fn + ".inp", [histories[name][:2] for name in names],
+                                    str_treg)
+            deck_histories[fn] = names
+
+        def on_done(job):
+            if not job.ok:
+                # Its outputs are not read, see RunOrigens()
+                return
+            names = deck_histories[job.name]
+            cases = [(case, histories[name][2]) for case, name
+                     in zip(OrigenDecayCases(len(names)), names)]
+            self.ReadOrigenResults(job.name, cases)
+            if cache is not None:
+                for name in names:
+                    container = histories[name][2]
+                    if len(container) > 0:
+                        cache.put(keys[name], container, self.tregs)
+
+        if len(deck_histories) > 0:
+            m_print.m_print(f"{len(pending)} Origen histories are run by {len(deck_histories)} decks")
+            for fn in deck_histories:
+                RemoveOrigenOutputs(fn)
+            RunOrigens([fn + ".inp" for fn in deck_histories], on_done)
+        if cache is not None:
+            cache.report()
+
+    def dose_kernel(self, bands):
+        ''' FA_Gamma.TDoseKernel of the Greens for the ORIGEN bands
+        '''
+        tensor = FA_Gamma.TGreenTensor.of(self.Greens, GREEN_TENSOR_DTYPE)
+        return FA_Gamma.TDoseKernel.read_cached(tensor, type(self).NRB, bands)
 
     def FACellDoseRate(self, cell, max_reg_hours):
+        return self.FACellsDoseRate([cell], max_reg_hours)[cell]
+
+    def FACellsDoseRate(self, cells, max_reg_hours):
+        ''' {cell: {zone: dose rates}} of the cells, the ORIGEN runs of
+            all cells spans are packed into the decks together
+        '''
         N_pts = 10
         precision = 1
         tmax_log = math.log(max_reg_hours)
@@ -751,81 +1205,49 @@ class TCoreHistory(object):
         self.tregs = [0.0] + self.tregs
         str_treg = "t = [" + " ".join(f"{v:.1f}" for v in self.tregs[1:]) + " ]"
 
-        cell_history = dict()
-        for FA_span in range(MCU_FA_spans):
-            cell_history[FA_span] = TFAspanHistory()
-        # Prepare the history for the given cell
-        for rec in self.HistoryReader.raw_data:
-            time = rec[self.TimeIndex]
-            pwr = rec[self.PowerIndex]
-            alg_name = rec[self.AlgIndex]
-            alg_FAs = int(rec[self.FAsIndex])
+        cells_src_spectrums = dict()
+        histories = dict()
+        for cell in cells:
+            cell_history = dict()
             for FA_span in range(MCU_FA_spans):
-                K = self.algorithms[(alg_name, alg_FAs)
-                                    ].FAs[cell].fissions[FA_span]
-                cell_history[FA_span].add_point(time, pwr*K)
-##        m_print.m_print(f"Cell {cell} history:")
-##        for FA_span in range(MCU_FA_spans):
-##            m_print.m_print(f"Span {FA_span}")
-##            m_print.m_print(cell_history[FA_span].history)
-
-        cell_src_spectrums = dict()
-        for FA_span in range(MCU_FA_spans):
-            fn = f"{cell}_{FA_span:d}"
-            str_t, str_power = cell_history[FA_span].build_origen_params()
-            MakeOrigenFile(fn + ".inp", str_t, str_power, str_treg)
-            RunOrigen(fn + ".inp")
-            cell_src_spectrums[FA_span] = dict()
-            self.ParseOrigenOut(fn + ".out", cell_src_spectrums[FA_span])
-
-        # Registered gamma energies
-        Zones0 = list(self.Greens[1].values())[0]
-        ERegs = list(list(Zones0.values())[0].keys())
-
-        # Iterate over registration zone
-        dose_arrays = dict()
-        reg_fluxes = dict()
-        for zone in range(130,150):
-            reg_fluxes[zone] = {k:[0.0]*len(self.tregs) for k in ERegs}
-
-            # Iterate over source span
-            for src in range(1, 1+MCU_FA_spans):
-                if src <= MCU_FA_spans // 2:
-                    IncGamma = self.Greens[src]
-                    reg_zone = zone
-                else:
-                    IncGamma = self.Greens[1+MCU_FA_spans - src]
-                    ZoneRemoteness = zone // 10
-                    ZoneHeight = zone % 10
-                    reg_zone = 10 * ZoneRemoteness + (MCU_FA_spans - ZoneHeight - 1)
-                # Iterate over incident energy
-                for Esrc in IncGamma:
-                    # Check whether the incident energy is in ORIGEN range
-                    for OrigenKey in cell_src_spectrums[0]:
-                        # OrigenKey is (Emin, Emax) like (1.191E+01, 8.090E+00)
-                        if OrigenKey[0] <= Esrc <= OrigenKey[1]:
-                            RegZone = IncGamma[Esrc][reg_zone]
-                            # Iterate over dissipated flux
-                            for flux in RegZone:
-                                # Accumulate gamma-flux in reg_fluxes
-                                # Iterate over registration time
-                                for n_pt, origen_out in enumerate(
-                                    cell_src_spectrums[src-1][OrigenKey]):
-                                    reg_fluxes[zone][flux][n_pt
-                                          ] += RegZone[flux] * origen_out
-                            break
-
-            # Now sum with the NRB weights to get the doze rate
-            dozeRates = [0.0] * len(self.tregs)
-            for E_NRB in type(self).NRB:
-                for Elow, EHigh in zip(ERegs[:-1], ERegs[1:]):
-                    if Elow <= E_NRB <= EHigh:
-                        # Iterate over reg time
-                        for n in range(len(dozeRates)):
-                            dozeRates[n] += reg_fluxes[zone][EHigh][n
-                                                ] * type(self).NRB[E_NRB] * 1e-12
-            dose_arrays[zone] = dozeRates
-        return dose_arrays
+                cell_history[FA_span] = TFAspanHistory()
+            # Prepare the history for the given cell
+            cell_no = self.fission_tensor.cell_nos[cell]
+            for rec in self.HistoryReader.raw_data:
+                time = rec[self.TimeIndex]
+                pwr = rec[self.PowerIndex]
+                alg_name = rec[self.AlgIndex]
+                alg_FAs = int(rec[self.FAsIndex])
+                K = self.fission_tensor.K[self.fission_tensor.alg_no(alg_name, alg_FAs),
+                                          cell_no].tolist()
+                for FA_span in range(MCU_FA_spans):
+                    cell_history[FA_span].add_point(time, pwr*K[FA_span])
+##            m_print.m_print(f"Cell {cell} history:")
+##            for FA_span in range(MCU_FA_spans):
+##                m_print.m_print(f"Span {FA_span}")
+##                m_print.m_print(cell_history[FA_span].history)
+
+            cell_src_spectrums = dict()
+            for FA_span in range(MCU_FA_spans):
+                str_t, str_power = cell_history[FA_span].build_origen_params()
+                cell_src_spectrums[FA_span] = dict()
+                histories[f"{cell}_{FA_span:d}"] = (str_t, str_power,
+                                                    cell_src_spectrums[FA_span])
+            cells_src_spectrums[cell] = cell_src_spectrums
+        # The spans are independent and may be run at once
+        self.RunOrigenHistories(histories, str_treg)
+
+        cells_dose_rates = dict()
+        for cell, cell_src_spectrums in cells_src_spectrums.items():
+            # Spans above MCU_FA_spans // 2 are the mirror images
+            # of the lower ones, see FA_Gamma.TDoseKernel.dose()
+            bands = list(cell_src_spectrums[0])
+            S = np.array([[cell_src_spectrums[FA_span][band] for band in bands]
+                          for FA_span in range(MCU_FA_spans)], dtype = np.float64)
+            dose_rates = self.dose_kernel(bands).dose(S, CellRegZones)
+            cells_dose_rates[cell] = {zone: dozeRates for zone, dozeRates
+                                      in zip(CellRegZones, dose_rates.tolist())}
+        return cells_dose_rates
 
 
     def FADoseRate(self, axial, zone, sources):
@@ -836,59 +1258,17 @@ class TCoreHistory(object):
         # Result is the list of doze rates in the reg zone, Sv/sec
         # for times after reactor trip in self.self.tregs
 
+        kernel = self.dose_kernel(list(sources))
+        K_axial = np.array([axial[FA_span] for FA_span in range(kernel.FA_spans)])
+        S = K_axial[:, None, None] * np.array(list(sources.values()),
+                                              dtype = np.float64)
+        return kernel.dose(S, [zone])[0].tolist()
 
-        # Registered gamma energies
-        Zones0 = list(self.Greens[1].values())[0]
-        ERegs = list(list(Zones0.values())[0].keys())
-        # m_print.m_print(ERegs)
-        # Initial zero flux in the reg zone
-        # times are kept in self.self.tregs
-        reg_fluxes = {k:[0.0]*len(self.tregs) for k in ERegs}
 
-        # Iterate over source span
-        for src in range(1, 11):
-            if src <= 5:
-                IncGamma = self.Greens[src]
-                reg_zone = zone
-            else:
-                IncGamma = self.Greens[11 - src]
-                ZoneRemoteness = zone // 10
-                ZoneHeight = zone % 10
-                reg_zone = 10 * ZoneRemoteness + (9 - ZoneHeight)
-            K_axial = axial[src-1]
-            # Iterate over incident energy
-            for Esrc in IncGamma:
-                # Check whether the incident energy is in ORIGEN range
-                for OrigenKey in sources:
-                    if OrigenKey[0] <= Esrc <= OrigenKey[1]:
-                        RegZone = IncGamma[Esrc][reg_zone]
-                        # Iterate over dissipated flux
-                        for flux in RegZone:
-                            # Accumulate gamma-flux in reg_fluxes
-                            # Iterate over registration time
-                            for n_pt, origen_out in enumerate(sources[OrigenKey]):
-                                reg_fluxes[flux][n_pt
-                                      ] += K_axial * RegZone[flux] * origen_out
-                        break
-        #m_print.m_print("Times are:")
-        #m_print.m_print(self.self.tregs)
-        #m_print.m_print("reg_fluxes are:")
-        #m_print.m_print(reg_fluxes)
-
-        # Now sum with the NRB weights to get the doze rate
-        dozeRates = [0.0] * len(self.tregs)
-        for E_NRB in type(self).NRB:
-            for Elow, EHigh in zip(ERegs[:-1], ERegs[1:]):
-                if Elow <= E_NRB <= EHigh:
-                    # Iterate over reg time
-                    for n in range(len(dozeRates)):
-                        dozeRates[n] += reg_fluxes[EHigh][n] * type(self).NRB[E_NRB] * 1e-12
-        return dozeRates
-
-
-def ReadStaticData(FINsListFile):
+def ReadStaticData(FINsListFile, workers = None):
+    global MCU_FA_spans
     fn = os.path.join(os.curdir, ConfigDIRName, FINsListFile)
-    FINsReader = DataReader.TDataReader(fn)
+    FINsReader = DataReader.read_cached(fn)
     m_print.m_print("Fields: ")
     m_print.m_print(FINsReader.fields)
     m_print.m_print(f"Total {len(FINsReader.raw_data)} data records")
@@ -901,22 +1281,46 @@ def ReadStaticData(FINsListFile):
     isRef_index = FINsReader.find_field_index(ReferenceField)
 
     fn = os.path.join(os.curdir, ConfigDIRName, MCU_FAs_fn)
-    FAs_reader = DataReader.TDataReader(fn)
+    FAs_reader = DataReader.read_cached(fn)
     fn = os.path.join(os.curdir, ConfigDIRName, detectors_eff_fn)
-    detectors_eff_reader = DataReader.TDataReader(fn)
+    detectors_eff_reader = DataReader.read_cached(fn)
     fn = os.path.join(os.curdir, ConfigDIRName, MCU_detectors_fn)
-    MCU_detectors_reader = DataReader.TDataReader(fn)
-
+    MCU_detectors_reader = DataReader.read_cached(fn)
+    readers = (FAs_reader, detectors_eff_reader, MCU_detectors_reader)
+    config_hash = MCU_config_hash() if CACHE_ALGORITHMS else None
+    if workers is None:
+        workers = FIN_PARSE_WORKERS
+
+    alg_keys = list()
+    FINfns = list()
+    alg_args = list()
     for alg_param in FINsReader.raw_data:
         alg_name = alg_param[alg_index]
         HCrit = alg_param[hcrit_index]
         NFAs = int(alg_param[NFAs_index])
         FINfn = alg_param[FINName_index]
         isRefAlg = alg_param[isRef_index]
-        alg = TAlgorithm(FAs_reader, detectors_eff_reader,
-                         MCU_detectors_reader,
-                         HCrit, NFAs, FINfn, isRefAlg)
-        alg_key = (alg_name, NFAs)
+        alg_keys.append((alg_name, NFAs))
+        FINfns.append(FINfn)
+        alg_args.append((HCrit, NFAs, FINfn, isRefAlg, config_hash))
+
+    if workers > 1 and len(alg_args) > 1:
+        # The .FIN files are independent, the results are merged
+        # in the FINsListFile order anyway
+        with concurrent.futures.ProcessPoolExecutor(
+                max_workers = min(workers, len(alg_args)),
+                initializer = init_FIN_worker,
+                initargs = (readers, READ_FIN_BLOCKS)) as executor:
+            parsed_algs = list(executor.map(parse_FIN, alg_args))
+        # MCU_FA_spans was adjusted in the worker processes only
+        for alg in parsed_algs:
+            for FA in alg.FAs.values():
+                MCU_FA_spans = max(MCU_FA_spans, max(FA.fissions) + 1)
+    else:
+        parsed_algs = (make_algorithm(readers, *args) for args in alg_args)
+
+    for alg_key, FINfn, alg in zip(alg_keys, FINfns, parsed_algs):
+        alg_name, NFAs = alg_key
         Algorithms[alg_key] = alg
         m_print.m_print(f"{FINfn} read successfully")
         m_print.m_print(f"{alg_name} {len(alg.FAs)} FAs {len(alg.detectors)} detectors {alg.total_fissions} fissions")
@@ -925,8 +1329,7 @@ def ReadStaticData(FINsListFile):
     m_print.m_print(f"{len(Algorithms)} algorithms/FIN files were read")
 
     # Now read reference detectors effectivenesses
-    fn = os.path.join(os.curdir, ConfigDIRName, detectors_eff_fn)
-    RefEffReader = DataReader.TDataReader(fn)
+    RefEffReader = detectors_eff_reader
 
     channel_index = RefEffReader.find_field_index(RefDetChannelField)
     eff_index = RefEffReader.find_field_index(RefDetEffectivenessField)
@@ -955,21 +1358,48 @@ def ReadStaticData(FINsListFile):
 
     return Algorithms
 
+def ReadGreens():
+    ''' Green functions for TCoreHistory and their FA_Gamma.TGreenTensor.
+        With CACHE_GREENS they are the memory mapped tensor itself, not
+        the nested dictionaries, TCoreHistory needs only the tensor
+    '''
+    if CACHE_GREENS:
+        GreenTensor = FA_Gamma.read_cached_greens().astype(GREEN_TENSOR_DTYPE)
+        return GreenTensor, GreenTensor
+    Greens = FA_Gamma.readGreenFuncs()
+    return Greens, FA_Gamma.TGreenTensor.of(Greens, GREEN_TENSOR_DTYPE)
+
 def InitStaticArray():
-    global Algorithms, Greens
+    global Algorithms, FissionTensor, Greens, GreenTensor
     Algorithms = ReadStaticData(FINsListFile)
-    Greens = FA_Gamma.readGreenFuncs()
+    FissionTensor = TFissionTensor.of(Algorithms)
+    if LAZY_GREENS and CACHE_GREENS:
+        Greens = FA_Gamma.TGreenLibrary()
+        GreenTensor = None
+    else:
+        Greens, GreenTensor = ReadGreens()
 
 def ProcessCell(cell, hours):
+    ProcessCells([cell], hours)
+
+def ProcessCells(cells, hours):
+    ''' Writes the dose rates files of the cells, their ORIGEN runs
+        are packed into the multi-case decks together
+    '''
     global Algorithms, Greens
-    CoreHistory = TCoreHistory(Algorithms, Greens)
-    dose_arrays_Svs = CoreHistory.FACellDoseRate(cell, hours)
-    cell_fn = f"{cell}.txt"
-    fn = os.path.join(os.curdir, ResultsDIRName, cell_fn)
-    dose_arrays_uSvhr = list()
-    for reg_zone in dose_arrays_Svs:
-        dose_arrays_uSvhr.append([Svs*3600*1e6 for Svs in dose_arrays_Svs[reg_zone]])
-    write_data_file(fn, CoreHistory.tregs, *dose_arrays_uSvhr)
+    if isinstance(Greens, FA_Gamma.TGreenLibrary):
+        # Cell reg zones are mirrored into themselves, see FACellDoseRate()
+        CoreHistory = TCoreHistory(Algorithms, Greens.greens(CellRegZones))
+    else:
+        CoreHistory = TCoreHistory(Algorithms, Greens)
+    cells_dose_rates = CoreHistory.FACellsDoseRate(cells, hours)
+    for cell, dose_arrays_Svs in cells_dose_rates.items():
+        cell_fn = f"{cell}.txt"
+        fn = os.path.join(os.curdir, ResultsDIRName, cell_fn)
+        dose_arrays_uSvhr = list()
+        for reg_zone in dose_arrays_Svs:
+            dose_arrays_uSvhr.append([Svs*3600*1e6 for Svs in dose_arrays_Svs[reg_zone]])
+        write_data_file(fn, CoreHistory.tregs, *dose_arrays_uSvhr)
 
 
 if __name__ == "__main__" and EXECUTE_NOW:
@@ -978,7 +1408,7 @@ if __name__ == "__main__" and EXECUTE_NOW:
           start_time.strftime(TIME_FORMAT))
 
     Algorithms = ReadStaticData(FINsListFile)
-    Greens = FA_Gamma.readGreenFuncs()
+    Greens, GreenTensor = ReadGreens()
 
     if not INIT_ONLY:
         try: